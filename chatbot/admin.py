@@ -1,13 +1,172 @@
+import datetime
+
 from django.contrib import admin
-from .models import UploadedFile
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db.models import Q, Sum
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .history import get_history_backend
+from .models import (
+    ChatMessage, ChatSession, ContentTypeStorageUsage, DailyStorageUsage,
+    SessionStorageUsage, UploadedFile,
+)
+from .search import get_search_backend
+
+# Query parameter holding the last file ID of the previous changelist page
+KEYSET_VAR = 'before'
+
+# Filtered changelists count at most this many rows
+COUNT_ESTIMATE_CAP = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses a precomputed row count instead of COUNT(*)."""
+    
+    def __init__(self, object_list, per_page, estimated_count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.estimated_count = estimated_count
+    
+    @cached_property
+    def count(self):
+        return self.estimated_count
+
+
+class ContentTypeListFilter(admin.SimpleListFilter):
+    """Content type filter whose choices come from the storage rollups."""
+    title = 'content type'
+    parameter_name = 'content_type'
+    
+    def lookups(self, request, model_admin):
+        # Avoids a SELECT DISTINCT over every uploaded file
+        content_types = ContentTypeStorageUsage.objects.order_by('content_type')
+        return [(c, c) for c in content_types.values_list('content_type', flat=True)]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(content_type=self.value())
+        return queryset
 
 
 @admin.register(UploadedFile)
 class UploadedFileAdmin(admin.ModelAdmin):
     list_display = ['original_filename', 'session_id', 'file_size_formatted', 'content_type', 'uploaded_at']
-    list_filter = ['content_type', 'uploaded_at']
+    list_filter = [ContentTypeListFilter, 'uploaded_at']
     search_fields = ['original_filename', 'session_id']
+    search_help_text = 'Words in the file name, or an exact session ID'
     readonly_fields = ['file_size_formatted', 'uploaded_at']
+    # IDs increase with upload time, which makes ID-based keyset pagination possible
+    ordering = ['-id']
+    show_full_result_count = False
+    change_list_template = 'admin/chatbot/uploadedfile/change_list.html'
+    
+    def get_urls(self):
+        return [
+            path(
+                'storage-usage/',
+                self.admin_site.admin_view(self.storage_usage_view),
+                name='chatbot_uploadedfile_storage_usage'
+            ),
+        ] + super().get_urls()
     
     def get_queryset(self, request):
-        return super().get_queryset(request).order_by('-uploaded_at')
+        queryset = super().get_queryset(request).order_by('-id')
+        before = getattr(request, 'keyset_before', None)
+        if before is not None:
+            queryset = queryset.filter(pk__lt=before)
+        return queryset
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains scans over the table
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        file_ids = get_search_backend().matching_file_ids(search_term)
+        return queryset.filter(Q(pk__in=file_ids) | Q(session_id=search_term)), False
+    
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return EstimatedCountPaginator(
+            queryset, per_page, self.estimate_count(request, queryset),
+            orphans=orphans, allow_empty_first_page=allow_empty_first_page
+        )
+    
+    def estimate_count(self, request, queryset):
+        """Count changelist rows from the rollups, or up to a cap when filtered."""
+        params = set(request.GET) - {ORDER_VAR, PAGE_VAR}
+        if params <= {ContentTypeListFilter.parameter_name}:
+            totals = ContentTypeStorageUsage.objects.all()
+            content_type = request.GET.get(ContentTypeListFilter.parameter_name)
+            if content_type:
+                totals = totals.filter(content_type=content_type)
+            return totals.aggregate(total=Sum('file_count'))['total'] or 0
+        return queryset.order_by()[:COUNT_ESTIMATE_CAP].count()
+    
+    def changelist_view(self, request, extra_context=None):
+        # Take the keyset cursor out of the query string so the changelist
+        # does not treat it as a field lookup
+        request.keyset_before = None
+        if KEYSET_VAR in request.GET:
+            before = request.GET.get(KEYSET_VAR)
+            request.GET = request.GET.copy()
+            del request.GET[KEYSET_VAR]
+            if before.isdigit():
+                request.keyset_before = int(before)
+        
+        response = super().changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None)
+        if not context or 'cl' not in context or ORDER_VAR in request.GET:
+            return response
+        
+        # Keyset pagination: each page starts below the last ID of the previous one
+        cl = context['cl']
+        results = list(cl.result_list)
+        context['keyset_pagination'] = True
+        context['keyset_first_url'] = cl.get_query_string(remove=[PAGE_VAR])
+        context['keyset_is_first_page'] = request.keyset_before is None
+        if len(results) >= cl.list_per_page:
+            context['keyset_next_url'] = cl.get_query_string(
+                {KEYSET_VAR: results[-1].pk}, remove=[PAGE_VAR]
+            )
+        return response
+    
+    def storage_usage_view(self, request):
+        """Dashboard of storage used per content type, session and day, read from the rollups."""
+        since = timezone.now().date() - datetime.timedelta(days=29)
+        by_content_type = list(ContentTypeStorageUsage.objects.all())
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Storage usage',
+            'total_files': sum(row.file_count for row in by_content_type),
+            'total_bytes': sum(row.total_bytes for row in by_content_type),
+            'by_content_type': by_content_type,
+            'top_sessions': SessionStorageUsage.objects.order_by('-total_bytes')[:20],
+            'by_day': DailyStorageUsage.objects.filter(day__gte=since).order_by('-day'),
+        }
+        return TemplateResponse(request, 'admin/chatbot/storage_usage.html', context)
+
+
+class ChatMessageInline(admin.TabularInline):
+    model = ChatMessage
+    fields = ['role', 'content', 'created_at']
+    readonly_fields = ['created_at']
+    extra = 0
+
+
+@admin.register(ChatSession)
+class ChatSessionAdmin(admin.ModelAdmin):
+    list_display = ['session_id', 'message_count', 'created_at', 'updated_at']
+    search_fields = ['session_id']
+    search_help_text = 'Words from any message in the conversation, or an exact session ID'
+    readonly_fields = ['message_count', 'created_at', 'updated_at']
+    inlines = [ChatMessageInline]
+    
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        get_history_backend().flush()
+        session_ids = get_search_backend().matching_session_ids(search_term)
+        return queryset.filter(Q(pk__in=session_ids) | Q(pk=search_term)), False
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_CONFIG = {
+    'WINDOW_SECONDS': 60,
+    'MIN_CALLS': 5,
+    'FAILURE_RATE_THRESHOLD': 0.5,
+    'SLOW_CALL_SECONDS': 20.0,
+    'SLOW_CALL_RATE_THRESHOLD': 0.8,
+    'OPEN_SECONDS': 30,
+    'HALF_OPEN_MAX_CALLS': 1,
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            f'Upstream model is temporarily unavailable. Retry in {retry_after:.0f}s.'
+        )
+
+
+class CircuitBreaker:
+    """Sliding-window circuit breaker based on error rate and slow-call rate."""
+
+    def __init__(self, name, window_seconds=60, min_calls=5,
+                 failure_rate_threshold=0.5, slow_call_seconds=20.0,
+                 slow_call_rate_threshold=0.8, open_seconds=30,
+                 half_open_max_calls=1, clock=time.monotonic):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.reset()
+
+    def reset(self):
+        """Return to the closed state and forget all recorded calls."""
+        with self._lock:
+            self._state = CLOSED
+            # Each entry: (finished_at, succeeded, duration_seconds)
+            self._calls = deque()
+            self._opened_at = None
+            self._half_open_in_flight = 0
+            self._times_opened = 0
+            self._rejected = 0
+            # Bumped on every open and close, so results of calls admitted
+            # before a transition can be told apart
+            self._generation += 1
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def before_call(self):
+        """Admit or reject a call. Raises CircuitOpenError when rejected.
+
+        Returns a ticket to pass to record_success/record_failure, so the
+        result is only counted against the state the call was admitted in.
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(self._retry_after())
+            if self._state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(self._retry_after())
+                self._half_open_in_flight += 1
+                return (self._generation, True)
+            return (self._generation, False)
+
+    def record_success(self, duration, ticket=None):
+        self._record(True, duration, ticket)
+
+    def record_failure(self, duration, ticket=None):
+        self._record(False, duration, ticket)
+
+    def snapshot(self):
+        """Return the current state and window statistics for monitoring."""
+        with self._lock:
+            self._refresh_state()
+            self._trim()
+            total, failures, slow = self._counts()
+            return {
+                'name': self.name,
+                'state': self._state,
+                'window_seconds': self.window_seconds,
+                'calls_in_window': total,
+                'failure_rate': failures / total if total else 0.0,
+                'slow_call_rate': slow / total if total else 0.0,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected,
+                'retry_after': self._retry_after() if self._state == OPEN else 0,
+            }
+
+    def _record(self, succeeded, duration, ticket=None):
+        with self._lock:
+            now = self._clock()
+            if ticket is not None:
+                generation, probe = ticket
+                if generation != self._generation or probe != (self._state == HALF_OPEN):
+                    # Admitted before the circuit opened or closed; its result
+                    # says nothing about the current state
+                    return
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                slow = duration >= self.slow_call_seconds
+                if succeeded and not slow:
+                    self._state = CLOSED
+                    self._generation += 1
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+
+            self._calls.append((now, succeeded, duration))
+            self._trim(now)
+            total, failures, slow = self._counts()
+            if total < self.min_calls:
+                return
+            if (failures / total >= self.failure_rate_threshold
+                    or slow / total >= self.slow_call_rate_threshold):
+                self._open(now)
+
+    def _open(self, now):
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = now
+        self._half_open_in_flight = 0
+        self._times_opened += 1
+        self._calls.clear()
+
+    def _refresh_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def _retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(0.0, self.open_seconds - (self._clock() - self._opened_at))
+
+    def _trim(self, now=None):
+        cutoff = (now if now is not None else self._clock()) - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _counts(self):
+        total = len(self._calls)
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, _, duration in self._calls if duration >= self.slow_call_seconds)
+        return total, failures, slow
+
+
+def _build_upstream_breaker():
+    config = {**DEFAULT_CONFIG, **getattr(settings, 'UPSTREAM_CIRCUIT_BREAKER', {})}
+    return CircuitBreaker(
+        'openai',
+        window_seconds=config['WINDOW_SECONDS'],
+        min_calls=config['MIN_CALLS'],
+        failure_rate_threshold=config['FAILURE_RATE_THRESHOLD'],
+        slow_call_seconds=config['SLOW_CALL_SECONDS'],
+        slow_call_rate_threshold=config['SLOW_CALL_RATE_THRESHOLD'],
+        open_seconds=config['OPEN_SECONDS'],
+        half_open_max_calls=config['HALF_OPEN_MAX_CALLS'],
+    )
+
+
+# Shared breaker guarding calls to the upstream model
+UPSTREAM_BREAKER = _build_upstream_breaker()
@@ -0,0 +1,40 @@
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# In-process subscribers to per-session change notifications
+# Structure: {session_id: {callback, ...}}
+_subscribers = defaultdict(set)
+_lock = threading.Lock()
+
+
+def subscribe_files_changed(session_id, callback):
+    """Call callback() whenever the files of a session change in this process."""
+    with _lock:
+        _subscribers[session_id].add(callback)
+
+
+def unsubscribe_files_changed(session_id, callback):
+    with _lock:
+        callbacks = _subscribers.get(session_id)
+        if callbacks is None:
+            return
+        callbacks.discard(callback)
+        if not callbacks:
+            del _subscribers[session_id]
+
+
+def publish_files_changed(session_id):
+    """Notify subscribers that a file was uploaded to or deleted from a session.
+
+    Callbacks run on the publishing thread and must not block.
+    """
+    with _lock:
+        callbacks = list(_subscribers.get(session_id, ()))
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Files-changed subscriber failed for session %s", session_id)
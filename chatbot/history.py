@@ -0,0 +1,544 @@
+import atexit
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.signals import request_finished, setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseHistoryBackend:
+    """Interface for chat history storage.
+
+    Messages are dicts of the form {"role": ..., "content": ...}, optionally
+    with a "file_info" dict.
+    """
+
+    def get_messages(self, session_id):
+        """Return a new list with the messages of a session, oldest first."""
+        raise NotImplementedError
+
+    def append(self, session_id, *messages):
+        """Append one or more messages to a session, creating it if needed."""
+        raise NotImplementedError
+
+    def clear(self, session_id):
+        """Delete a session and all its messages.
+
+        Forks of the session keep the messages they inherited from it.
+        """
+        raise NotImplementedError
+
+    def fork(self, session_id, new_session_id, message_count=None):
+        """Start new_session_id with the first message_count messages of session_id.
+
+        The fork points at its parent instead of copying its messages, so it
+        takes constant time and space; the shared messages are read on
+        demand. Defaults to the whole history. Returns the fork's message
+        count. Raises LookupError if the session doesn't exist and
+        ValueError if it has fewer than message_count messages.
+        """
+        raise NotImplementedError
+
+    def session_summaries(self, offset=0, limit=None):
+        """Return {session_id: {"message_count": int, "last_message": str}}.
+
+        offset and limit select a page of sessions, most recent first where
+        the backend tracks activity.
+        """
+        raise NotImplementedError
+
+    def memory_stats(self):
+        """Return statistics about the history held in this process."""
+        return {}
+
+    def flush(self):
+        """Persist any buffered writes."""
+
+    def maybe_flush(self):
+        """Persist buffered writes if the backend's flush policy says so."""
+
+
+def summarize_last_message(messages):
+    return messages[-1]['content'][:50] + '...' if messages else 'No messages'
+
+
+def inherited_segments(session_id, parent_of):
+    """Return the stored message ranges that make up a session's history.
+
+    parent_of(session_id) returns (parent_id, fork_point), where fork_point
+    is how many of the parent's messages the session starts with, or
+    (None, 0) for a session that isn't a fork. The result is
+    [(session_id, limit), ...] from the root down: the first ``limit`` own
+    messages of each ancestor (all of them for None), in order.
+    """
+    segments = []
+    visible = None
+    while session_id is not None:
+        parent_id, fork_point = parent_of(session_id)
+        limit = None if visible is None else max(0, visible - fork_point)
+        segments.append((session_id, limit))
+        visible = fork_point if visible is None else min(visible, fork_point)
+        session_id = parent_id
+    segments.reverse()
+    return segments
+
+
+def check_fork_point(message_count, available):
+    if message_count is None:
+        return available
+    if message_count < 0 or message_count > available:
+        raise ValueError(f'message_count must be between 0 and {available}')
+    return message_count
+
+
+class MemoryHistoryBackend(BaseHistoryBackend):
+    """Per-process, in-memory history. Lost on restart and not shared between workers.
+
+    Sessions not used for ``compress_after`` seconds are moved to a cold
+    tier as zlib-compressed JSON and inflated again the next time they are
+    read or appended to, so idle conversations take a fraction of the
+    memory. At most ``compress_batch`` sessions are compressed per call, so
+    a backlog of idle sessions is worked off over several requests rather
+    than stalling one. Set ``compress_after`` to None to keep everything
+    uncompressed.
+    """
+
+    def __init__(self, compress_after=300, compression_level=6, compress_batch=8,
+                 clock=time.monotonic):
+        self.compress_after = compress_after
+        self.compression_level = compression_level
+        self.compress_batch = compress_batch
+        self._clock = clock
+        self._lock = threading.RLock()
+        # Hot tier. Structure: {session_id: [{"role": "user/assistant", "content": "message"}, ...]}
+        # holding only the messages added to the session itself
+        self.sessions = {}
+        # Cold tier: {session_id: (blob, raw_size, message_count, last_message)}
+        self._cold = {}
+        # {session_id: last_used}, least recently used first
+        self._last_used = OrderedDict()
+        # Forks: {session_id: (parent_session_id, fork_point)}
+        self.parents = {}
+        self._stats = {
+            'compressions': 0,
+            'decompressions': 0,
+            'decompress_seconds': 0.0,
+            'max_decompress_seconds': 0.0,
+        }
+
+    def get_messages(self, session_id):
+        with self._lock:
+            messages = []
+            for segment_id, limit in inherited_segments(session_id, self._parent_of):
+                messages.extend(self._own(segment_id)[:limit])
+            self._compress_idle()
+            return messages
+
+    def append(self, session_id, *messages):
+        with self._lock:
+            if session_id not in self.sessions and session_id not in self._cold:
+                self.sessions[session_id] = []
+            self._own(session_id).extend(messages)
+            self._compress_idle()
+
+    def clear(self, session_id):
+        with self._lock:
+            # Give forks their own copy of what they inherited before it goes away
+            for child_id, (parent_id, _) in list(self.parents.items()):
+                if parent_id == session_id:
+                    messages = self.get_messages(child_id)
+                    self._cold.pop(child_id, None)
+                    self.sessions[child_id] = messages
+                    self._last_used[child_id] = self._clock()
+                    del self.parents[child_id]
+            self.sessions.pop(session_id, None)
+            self._cold.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+            self.parents.pop(session_id, None)
+
+    def fork(self, session_id, new_session_id, message_count=None):
+        with self._lock:
+            if (session_id not in self.sessions and session_id not in self._cold
+                    and session_id not in self.parents):
+                raise LookupError(f'Unknown session: {session_id}')
+            message_count = check_fork_point(message_count, self._length(session_id))
+            self.parents[new_session_id] = (session_id, message_count)
+            return message_count
+
+    def session_summaries(self, offset=0, limit=None):
+        with self._lock:
+            session_ids = list({**self.sessions, **self._cold, **self.parents})
+            end = None if limit is None else offset + limit
+            summaries = {}
+            for session_id in session_ids[offset:end]:
+                if session_id in self._cold:
+                    # Summarize from the metadata kept next to the blob
+                    last_message = self._cold[session_id][3]
+                else:
+                    last_message = summarize_last_message(
+                        self.sessions.get(session_id) or self.get_messages(session_id)
+                    )
+                summaries[session_id] = {
+                    'message_count': self._length(session_id),
+                    'last_message': last_message
+                }
+            return summaries
+
+    def memory_stats(self):
+        """Return the size of each tier and the cost of compressing sessions."""
+        with self._lock:
+            raw_bytes = sum(entry[1] for entry in self._cold.values())
+            compressed_bytes = sum(len(entry[0]) for entry in self._cold.values())
+            decompressions = self._stats['decompressions']
+            return {
+                'hot_sessions': len(self.sessions),
+                'cold_sessions': len(self._cold),
+                'cold_raw_bytes': raw_bytes,
+                'cold_compressed_bytes': compressed_bytes,
+                'bytes_saved': raw_bytes - compressed_bytes,
+                'compressions': self._stats['compressions'],
+                'decompressions': decompressions,
+                'avg_decompress_ms': round(
+                    self._stats['decompress_seconds'] * 1000 / decompressions, 3
+                ) if decompressions else 0.0,
+                'max_decompress_ms': round(self._stats['max_decompress_seconds'] * 1000, 3),
+            }
+
+    def _own(self, session_id):
+        """Return the session's own message list, inflating it if it is cold."""
+        entry = self._cold.pop(session_id, None)
+        if entry is not None:
+            started = time.perf_counter()
+            self.sessions[session_id] = json.loads(zlib.decompress(entry[0]))
+            elapsed = time.perf_counter() - started
+            self._stats['decompressions'] += 1
+            self._stats['decompress_seconds'] += elapsed
+            self._stats['max_decompress_seconds'] = max(self._stats['max_decompress_seconds'], elapsed)
+        messages = self.sessions.get(session_id)
+        if messages is None:
+            return []
+        self._last_used[session_id] = self._clock()
+        self._last_used.move_to_end(session_id)
+        return messages
+
+    def _compress_idle(self):
+        if self.compress_after is None:
+            return
+        cutoff = self._clock() - self.compress_after
+        compressed = 0
+        # Oldest first, so this stops at the first session still in use
+        while self._last_used and compressed < self.compress_batch:
+            session_id, last_used = next(iter(self._last_used.items()))
+            if last_used > cutoff:
+                break
+            del self._last_used[session_id]
+            if not self.sessions.get(session_id):
+                # Nothing to save, e.g. a fork with no messages of its own
+                continue
+            messages = self.sessions.pop(session_id)
+            compressed += 1
+            raw = json.dumps(messages, separators=(',', ':')).encode()
+            self._cold[session_id] = (
+                zlib.compress(raw, self.compression_level),
+                len(raw),
+                len(messages),
+                summarize_last_message(messages),
+            )
+            self._stats['compressions'] += 1
+
+    def _parent_of(self, session_id):
+        return self.parents.get(session_id, (None, 0))
+
+    def _length(self, session_id):
+        if session_id in self._cold:
+            own_count = self._cold[session_id][2]
+        else:
+            own_count = len(self.sessions.get(session_id, []))
+        return self._parent_of(session_id)[1] + own_count
+
+
+class DatabaseHistoryBackend(BaseHistoryBackend):
+    """History stored in ChatSession/ChatMessage rows, shared by all workers.
+
+    Appends are buffered and written in one transaction when the request
+    that made them finishes, so the next turn sees them whichever worker
+    serves it; HTTP turns are not batched across requests. Appends made
+    outside a request (background jobs, WebSocket turns) are batched: they
+    are written once ``flush_size`` messages are pending
+    or, by a background thread, once the oldest is ``flush_interval``
+    seconds old. The buffer is also flushed at exit.
+
+    Recently used sessions are kept in an LRU read-through cache. Entries
+    older than ``cache_ttl`` seconds are reloaded so that messages written
+    by other workers become visible.
+    """
+
+    def __init__(self, flush_size=50, flush_interval=2.0, cache_size=1000,
+                 cache_ttl=5.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._lock = threading.RLock()
+        # Pending writes: [(session_id, message, appended_at), ...]
+        self._pending = []
+        self._oldest_pending_at = None
+        # {session_id: (loaded_at, [message, ...])}, least recently used first
+        self._cache = OrderedDict()
+        self._flusher = None
+
+    def get_messages(self, session_id):
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None and time.monotonic() - entry[0] < self.cache_ttl:
+                self._cache.move_to_end(session_id)
+                return list(entry[1])
+            if any(pending[0] == session_id for pending in self._pending):
+                self.flush()
+            messages = self._load(session_id)
+            self._cache_put(session_id, messages)
+            return list(messages)
+
+    def append(self, session_id, *messages):
+        with self._lock:
+            appended_at = timezone.now()
+            for message in messages:
+                self._pending.append((session_id, message, appended_at))
+            if self._oldest_pending_at is None:
+                self._oldest_pending_at = time.monotonic()
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                entry[1].extend(messages)
+                self._cache.move_to_end(session_id)
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_periodically, name='chat-history-flush', daemon=True
+                )
+                self._flusher.start()
+            self.maybe_flush()
+
+    def clear(self, session_id):
+        from .models import ChatMessage, ChatSession
+
+        with self._lock:
+            self._pending = [p for p in self._pending if p[0] != session_id]
+            if not self._pending:
+                self._oldest_pending_at = None
+            self._cache.pop(session_id, None)
+            children = list(ChatSession.objects.filter(parent_id=session_id))
+            if children:
+                self.flush()
+            with transaction.atomic():
+                # Give forks their own copy of what they inherited before it goes away
+                for child in children:
+                    rows = self._load_rows(child.session_id)
+                    ChatMessage.objects.filter(session=child).delete()
+                    ChatMessage.objects.bulk_create([
+                        ChatMessage(
+                            session=child,
+                            role=m.role,
+                            content=m.content,
+                            file_info=m.file_info,
+                            created_at=m.created_at
+                        )
+                        for m in rows
+                    ])
+                    child.parent = None
+                    child.fork_point = 0
+                    child.save(update_fields=['parent', 'fork_point'])
+                ChatSession.objects.filter(session_id=session_id).delete()
+
+    def fork(self, session_id, new_session_id, message_count=None):
+        from .models import ChatSession
+
+        with self._lock:
+            # The fork reads its parent's messages from the database
+            if any(pending[0] == session_id for pending in self._pending):
+                self.flush()
+            available = (
+                ChatSession.objects.filter(session_id=session_id)
+                .values_list('message_count', flat=True).first()
+            )
+            if available is None:
+                raise LookupError(f'Unknown session: {session_id}')
+            message_count = check_fork_point(message_count, available)
+            ChatSession.objects.create(
+                session_id=new_session_id, parent_id=session_id,
+                fork_point=message_count, message_count=message_count
+            )
+            return message_count
+
+    def session_summaries(self, offset=0, limit=None):
+        from django.db.models import OuterRef, Subquery
+        from .models import ChatMessage, ChatSession
+
+        self.flush()
+        sessions = ChatSession.objects.order_by('-updated_at').annotate(
+            last_content=Subquery(
+                ChatMessage.objects.filter(session=OuterRef('pk'))
+                .order_by('-id').values('content')[:1]
+            ),
+        )
+        end = None if limit is None else offset + limit
+        summaries = {}
+        for session in sessions[offset:end]:
+            if session.last_content is None and session.parent_id:
+                last_messages = self.get_messages(session.session_id)[-1:]
+            elif session.last_content is None:
+                last_messages = []
+            else:
+                last_messages = [{'content': session.last_content}]
+            summaries[session.session_id] = {
+                'message_count': session.message_count,
+                'last_message': summarize_last_message(last_messages)
+            }
+        return summaries
+
+    def memory_stats(self):
+        with self._lock:
+            return {
+                'cached_sessions': len(self._cache),
+                'pending_messages': len(self._pending),
+            }
+
+    def maybe_flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            if (len(self._pending) >= self.flush_size
+                    or time.monotonic() - self._oldest_pending_at >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        from django.db.models import F
+        from .models import ChatMessage, ChatSession
+
+        with self._lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = []
+            self._oldest_pending_at = None
+            try:
+                appended = Counter(p[0] for p in batch)
+                with transaction.atomic():
+                    ChatSession.objects.bulk_create(
+                        [ChatSession(session_id=session_id) for session_id in appended],
+                        ignore_conflicts=True
+                    )
+                    ChatMessage.objects.bulk_create([
+                        ChatMessage(
+                            session_id=session_id,
+                            role=message['role'],
+                            content=message['content'],
+                            file_info=message.get('file_info'),
+                            created_at=appended_at
+                        )
+                        for session_id, message, appended_at in batch
+                    ])
+                    # One UPDATE per distinct batch size rather than per session
+                    by_count = defaultdict(list)
+                    for session_id, count in appended.items():
+                        by_count[count].append(session_id)
+                    now = timezone.now()
+                    for count, ids in by_count.items():
+                        ChatSession.objects.filter(session_id__in=ids).update(
+                            message_count=F('message_count') + count, updated_at=now
+                        )
+            except Exception:
+                # Keep the messages so the next flush retries them
+                self._pending = batch + self._pending
+                self._oldest_pending_at = time.monotonic()
+                raise
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.maybe_flush()
+            except Exception:
+                logger.exception("Failed to flush chat history")
+            finally:
+                close_old_connections()
+
+    def _load(self, session_id):
+        return [m.to_dict() for m in self._load_rows(session_id)]
+
+    def _load_rows(self, session_id):
+        from .models import ChatMessage
+
+        rows = []
+        for segment_id, limit in inherited_segments(session_id, self._parent_of):
+            messages = ChatMessage.objects.filter(session_id=segment_id)
+            if limit is not None:
+                messages = messages[:limit]
+            rows.extend(messages)
+        return rows
+
+    def _parent_of(self, session_id):
+        from .models import ChatSession
+
+        row = (
+            ChatSession.objects.filter(session_id=session_id)
+            .values_list('parent_id', 'fork_point').first()
+        )
+        return row or (None, 0)
+
+    def _cache_put(self, session_id, messages):
+        self._cache[session_id] = (time.monotonic(), messages)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_history_backend():
+    """Return the history backend configured by settings.CHAT_HISTORY."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'CHAT_HISTORY', {})
+                backend_class = import_string(
+                    config.get('BACKEND', 'chatbot.history.MemoryHistoryBackend')
+                )
+                _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+def _flush_backend():
+    if _backend is None:
+        return
+    try:
+        _backend.flush()
+    except Exception:
+        logger.exception("Failed to flush chat history")
+
+
+@receiver(request_finished)
+def _flush_on_request_finished(sender, **kwargs):
+    _flush_backend()
+
+
+@receiver(setting_changed)
+def _reset_backend(sender, setting, **kwargs):
+    global _backend
+    if setting == 'CHAT_HISTORY':
+        _flush_backend()
+        _backend = None
+
+
+atexit.register(_flush_backend)
@@ -0,0 +1,259 @@
+import base64
+import functools
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+
+# Derivative kinds and the format each is encoded in
+MODEL = 'model'
+THUMBNAIL = 'thumb'
+FORMATS = {MODEL: ('JPEG', 'jpg', 'image/jpeg'), THUMBNAIL: ('WEBP', 'webp', 'image/webp')}
+
+# content_hash of an upload that could not be processed
+FAILED = ''
+
+DEFAULT_CONFIG = {
+    'WORKERS': 2,
+    'MODEL_MAX_SIDE': 1024,
+    'MODEL_QUALITY': 80,
+    'MODEL_DETAIL': 'auto',
+    'THUMBNAIL_SIZE': 256,
+    'THUMBNAIL_QUALITY': 70,
+}
+
+
+def image_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_IMAGES', {})}
+
+
+def derivative_name(content_hash, kind):
+    """Return the storage name of a derivative, sharded like the uploads."""
+    ext = FORMATS[kind][1]
+    return f'derivatives/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}-{kind}.{ext}'
+
+
+def hash_file(field):
+    digest = hashlib.sha256()
+    with field.open('rb') as f:
+        for chunk in f.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode(image, max_side, kind, quality):
+    """Downscale a copy of image to fit max_side and encode it without metadata."""
+    image = image.copy()
+    image.thumbnail((max_side, max_side))
+    out = io.BytesIO()
+    # Saving without exif= drops EXIF, GPS and other metadata
+    image.save(out, FORMATS[kind][0], quality=quality)
+    return out.getvalue()
+
+
+def ensure_derivatives(upload):
+    """Create the model and thumbnail derivatives of an uploaded image.
+
+    Derivatives are keyed by the hash of the original's contents, so an
+    image uploaded again is only hashed, not decoded and re-encoded.
+    Records the hash on the upload and returns it. If the file can't be
+    processed, records FAILED instead so it isn't retried, and returns None.
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logger.warning("Pillow is not installed; images won't be sent to the model")
+        return None
+
+    try:
+        content_hash = hash_file(upload.file)
+        _create_missing(upload, content_hash)
+        type(upload).objects.filter(pk=upload.pk).update(content_hash=content_hash)
+        # release_derivatives may have deleted them before the hash was visible
+        _create_missing(upload, content_hash)
+    except Exception:
+        logger.exception("Failed to create derivatives for upload %s", upload.pk)
+        type(upload).objects.filter(pk=upload.pk).update(content_hash=FAILED)
+        upload.content_hash = FAILED
+        return None
+
+    upload.content_hash = content_hash
+    return content_hash
+
+
+def _create_missing(upload, content_hash):
+    from PIL import Image, ImageOps
+
+    config = image_config()
+    names = {kind: derivative_name(content_hash, kind) for kind in FORMATS}
+    missing = [kind for kind, name in names.items() if not default_storage.exists(name)]
+    if not missing:
+        return
+    with upload.file.open('rb') as f, Image.open(f) as image:
+        sizes = {
+            MODEL: (config['MODEL_MAX_SIDE'], config['MODEL_QUALITY']),
+            THUMBNAIL: (config['THUMBNAIL_SIZE'], config['THUMBNAIL_QUALITY']),
+        }
+        # Let the JPEG decoder skip detail we're about to throw away
+        image.draft('RGB', (config['MODEL_MAX_SIDE'],) * 2)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            # Flatten transparency onto white; the first frame of an animation
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba)
+            image = background
+        for kind in missing:
+            max_side, quality = sizes[kind]
+            data = encode(image, max_side, kind, quality)
+            if not default_storage.exists(names[kind]):
+                default_storage.save(names[kind], ContentFile(data))
+
+
+def release_derivatives(content_hash):
+    """Delete the derivatives of content_hash once no upload uses them."""
+    from .models import UploadedFile
+
+    if not content_hash or UploadedFile.objects.filter(content_hash=content_hash).exists():
+        return
+    for kind in FORMATS:
+        default_storage.delete(derivative_name(content_hash, kind))
+    _data_url.cache_clear()
+    # An upload of the same image may have recorded the hash meanwhile
+    upload = UploadedFile.objects.filter(content_hash=content_hash).first()
+    if upload is not None:
+        ensure_derivatives(upload)
+
+
+def thumbnail_url(upload):
+    if not upload.content_hash:
+        return None
+    return default_storage.url(derivative_name(upload.content_hash, THUMBNAIL))
+
+
+@functools.lru_cache(maxsize=64)
+def _data_url(content_hash):
+    with default_storage.open(derivative_name(content_hash, MODEL), 'rb') as f:
+        data = base64.b64encode(f.read()).decode('ascii')
+    return f'data:{FORMATS[MODEL][2]};base64,{data}'
+
+
+def model_input(messages):
+    """Convert chat history into model input, attaching image derivatives.
+
+    User messages that record an image upload get the downscaled model
+    derivative attached rather than the original file. Images that are
+    deleted or could not be processed are left out.
+    """
+    from .models import UploadedFile
+
+    image_ids = [
+        info['id'] for m in messages for info in _file_infos(m)
+        if info.get('type') in IMAGE_TYPES
+    ]
+    uploads = UploadedFile.objects.in_bulk(image_ids) if image_ids else {}
+    detail = image_config()['MODEL_DETAIL']
+
+    converted = []
+    for message in messages:
+        entry = {'role': message['role'], 'content': message['content']}
+        images = []
+        for info in _file_infos(message):
+            upload = uploads.get(info['id'])
+            if upload is None:
+                continue
+            image_url = _image_url(upload)
+            if image_url:
+                images.append({'type': 'input_image', 'image_url': image_url, 'detail': detail})
+        if images:
+            entry['content'] = [{'type': 'input_text', 'text': message['content']}] + images
+        converted.append(entry)
+    return converted
+
+
+def _image_url(upload):
+    # Processing may not have finished yet for a just-uploaded image
+    content_hash = upload.content_hash
+    if content_hash is None:
+        content_hash = ensure_derivatives(upload)
+    if not content_hash:
+        return None
+    try:
+        return _data_url(content_hash)
+    except OSError:
+        # The derivative went missing from storage; make it again
+        logger.warning("Model image for upload %s is missing; recreating it", upload.pk)
+    if not ensure_derivatives(upload):
+        return None
+    try:
+        return _data_url(content_hash)
+    except OSError:
+        logger.exception("Failed to read the model image for upload %s", upload.pk)
+        return None
+
+
+def _file_infos(message):
+    # Batch uploads record {"files": [...]}, single uploads the file itself
+    file_info = message.get('file_info') or {}
+    return file_info.get('files', [file_info] if file_info else [])
+
+
+def process_upload(upload_id):
+    """Create derivatives for an upload and tell the session's clients."""
+    from . import events
+    from .models import UploadedFile
+
+    try:
+        upload = UploadedFile.objects.filter(pk=upload_id).first()
+        if upload is not None and ensure_derivatives(upload):
+            events.publish_files_changed(upload.session_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=image_config()['WORKERS'], thread_name_prefix='chat-images'
+                )
+    return _executor
+
+
+def schedule_derivatives(upload):
+    """Process an image upload in the background once it is committed.
+
+    With WORKERS set to 0 the derivatives are made before returning.
+    """
+    if upload.content_type not in IMAGE_TYPES:
+        return
+    if not image_config()['WORKERS']:
+        ensure_derivatives(upload)
+        return
+    transaction.on_commit(lambda: get_executor().submit(process_upload, upload.pk))
+
+
+@receiver(setting_changed)
+def _reset_executor(sender, setting, **kwargs):
+    global _executor
+    if setting == 'CHAT_IMAGES':
+        # Running tasks finish on the old pool
+        _executor = None
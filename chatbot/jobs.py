@@ -0,0 +1,306 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+DEFAULT_CONFIG = {
+    'WORKERS': 4,
+    'RESERVED_INTERACTIVE_WORKERS': 1,
+    'MAX_QUEUED': 100,
+    'RESULT_TTL': 600,
+    'MAX_WAIT': 30,
+    'POLL_INTERVAL': 0.25,
+}
+
+
+class QueueFullError(Exception):
+    """Raised when a lane already holds the maximum number of queued jobs."""
+
+
+class ChatJob:
+    """A chat completion running outside the request that submitted it."""
+
+    def __init__(self, session_id, message, priority=INTERACTIVE):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.message = message
+        self.priority = priority
+        self.status = QUEUED
+        self.response = None
+        self.error = None
+        self.retryable = False
+        self.message_count = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return job_to_dict(self)
+
+
+def job_to_dict(job):
+    """Return the status response for a ChatJob or a ChatJobRecord."""
+    data = {
+        'job_id': job.id,
+        'session_id': job.session_id,
+        'priority': job.priority,
+        'status': job.status,
+    }
+    if job.status == SUCCEEDED:
+        data['response'] = job.response
+        data['message_count'] = job.message_count
+    elif job.status == FAILED:
+        data['error'] = job.error
+        data['retryable'] = job.retryable
+    return data
+
+
+class ChatJobQueue:
+    """Bounded worker pool running chat jobs from two priority lanes.
+
+    Interactive jobs are always taken first, and bulk jobs may never occupy
+    the ``reserved_interactive_workers`` last free workers, so interactive
+    chats are not stuck behind a backlog of long bulk completions.
+
+    ``record_job``, if given, is called with a job whenever its status
+    changes, so the status can be kept where other processes can read it.
+    """
+
+    def __init__(self, run_job, workers=4, reserved_interactive_workers=1,
+                 max_queued=100, result_ttl=600, record_job=None):
+        self.run_job = run_job
+        self.record_job = record_job
+        self.workers = workers
+        self.max_bulk_running = max(0, workers - reserved_interactive_workers)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._condition = threading.Condition()
+        self._lanes = {lane: deque() for lane in LANES}
+        self._bulk_running = 0
+        # {job_id: job}, oldest first, for status lookups
+        self._jobs = OrderedDict()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'chat-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, session_id, message, priority=INTERACTIVE):
+        if priority not in LANES:
+            raise ValueError(f'Unknown priority: {priority}')
+        job = ChatJob(session_id, message, priority)
+        with self._condition:
+            self._expire()
+            if len(self._lanes[priority]) >= self.max_queued:
+                raise QueueFullError(f'Too many queued {priority} jobs')
+            self._jobs[job.id] = job
+            # Recorded before a worker can pick it up and record it as running
+            self._record(job)
+            self._lanes[priority].append(job)
+            self._condition.notify()
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'workers': self.workers,
+                'queued': {lane: len(jobs) for lane, jobs in self._lanes.items()},
+                'bulk_running': self._bulk_running,
+                'tracked_jobs': len(self._jobs),
+            }
+
+    def process_one(self, block=True):
+        """Run the next job on the calling thread. Returns the job, or None."""
+        job = self._take(block)
+        if job is not None:
+            self._execute(job)
+        return job
+
+    def _work(self):
+        while True:
+            self.process_one()
+
+    def _take(self, block):
+        with self._condition:
+            while True:
+                if self._lanes[INTERACTIVE]:
+                    return self._lanes[INTERACTIVE].popleft()
+                if self._lanes[BULK] and self._bulk_running < self.max_bulk_running:
+                    self._bulk_running += 1
+                    return self._lanes[BULK].popleft()
+                if not block:
+                    return None
+                self._condition.wait()
+
+    def _execute(self, job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._record(job)
+        try:
+            job.response, job.message_count = self.run_job(job)
+            job.status = SUCCEEDED
+        except CircuitOpenError as e:
+            job.error = str(e)
+            job.retryable = True
+            job.status = FAILED
+        except Exception as e:
+            logger.exception("Chat job %s failed", job.id)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            self._record(job)
+            close_old_connections()
+            with self._condition:
+                if job.priority == BULK:
+                    self._bulk_running -= 1
+                    self._condition.notify()
+            job.done.set()
+
+    def _record(self, job):
+        if self.record_job is None:
+            return
+        try:
+            self.record_job(job)
+        except Exception:
+            # Pollers on this process still see the job
+            logger.exception("Failed to record chat job %s", job.id)
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if job.finished_at is None or job.finished_at >= cutoff:
+                break
+            self._jobs.popitem(last=False)
+
+
+def run_chat_job(job):
+    """Generate the reply for a job and append the turn to the session history."""
+    from .history import get_history_backend
+    from .views import generate_response
+
+    history = get_history_backend()
+    user_entry = {"role": "user", "content": job.message}
+    messages = history.get_messages(job.session_id) + [user_entry]
+    ai_response = generate_response(messages, job.message)
+    history.append(job.session_id, user_entry, {
+        "role": "assistant",
+        "content": ai_response
+    })
+    return ai_response, len(messages) + 1
+
+
+def _datetime(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def save_job_record(job):
+    """Store a job's status in a ChatJobRecord; drop records past RESULT_TTL."""
+    from .models import ChatJobRecord
+
+    ChatJobRecord(
+        id=job.id,
+        session_id=job.session_id,
+        priority=job.priority,
+        status=job.status,
+        response=job.response,
+        error=job.error,
+        retryable=job.retryable,
+        message_count=job.message_count,
+        created_at=_datetime(job.created_at),
+        finished_at=_datetime(job.finished_at),
+    ).save()
+    if job.finished_at is not None:
+        cutoff = _datetime(job.finished_at - job_config()['RESULT_TTL'])
+        ChatJobRecord.objects.filter(finished_at__lt=cutoff).delete()
+
+
+def job_status(job_id, wait=0):
+    """Return the status response for a job, or None if it is unknown.
+
+    Jobs accepted by this process are read from the queue. Jobs accepted by
+    another worker are read from their ChatJobRecord, which is polled every
+    POLL_INTERVAL seconds while waiting for the job to finish.
+    """
+    from .models import ChatJobRecord
+
+    config = job_config()
+    wait = min(wait, config['MAX_WAIT'])
+    job = get_job_queue().get(job_id)
+    if job is not None:
+        if wait > 0:
+            job.done.wait(wait)
+        return job.to_dict()
+
+    deadline = time.monotonic() + wait
+    while True:
+        record = ChatJobRecord.objects.filter(pk=job_id).first()
+        if record is None:
+            return None
+        if record.status in (SUCCEEDED, FAILED) or time.monotonic() >= deadline:
+            return job_to_dict(record)
+        time.sleep(config['POLL_INTERVAL'])
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def job_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_JOBS', {})}
+
+
+def get_job_queue():
+    """Return the process-wide job queue, starting its workers on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                config = job_config()
+                queue = ChatJobQueue(
+                    run_chat_job,
+                    workers=config['WORKERS'],
+                    reserved_interactive_workers=config['RESERVED_INTERACTIVE_WORKERS'],
+                    max_queued=config['MAX_QUEUED'],
+                    result_ttl=config['RESULT_TTL'],
+                    record_job=save_job_record,
+                )
+                queue.start()
+                _queue = queue
+    return _queue
+
+
+@receiver(setting_changed)
+def _reset_queue(sender, setting, **kwargs):
+    global _queue
+    if setting == 'CHAT_JOBS':
+        # Workers of the old queue stay idle on their own condition
+        _queue = None
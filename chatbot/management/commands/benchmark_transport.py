@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+import uuid
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from chatbot.history import get_history_backend
+from chatbot.websocket import chat_websocket
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare messages per second and server CPU time of the HTTP chat "
+        "endpoints against the WebSocket transport. Both are driven in-process "
+        "through their ASGI applications with mock responses, so the numbers "
+        "reflect server-side cost without network or upstream latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200,
+                            help='Chat messages sent per transport (default: 200)')
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        with override_settings(OPENAI_API_KEY=None, ALLOWED_HOSTS=['testserver']):
+            results = asyncio.run(self._run(count))
+
+        self.stdout.write(f"{'scenario':<28}{'msgs':>8}{'msg/s':>12}{'CPU ms/msg':>14}")
+        for name, messages, wall, cpu in results:
+            self.stdout.write(
+                f"{name:<28}{messages:>8}{messages / wall:>12.1f}{cpu * 1000 / messages:>14.3f}"
+            )
+
+    async def _run(self, count):
+        http_app = get_asgi_application()
+        http_session = f"benchmark-{uuid.uuid4()}"
+        ws_session = f"benchmark-{uuid.uuid4()}"
+        results = []
+        try:
+            results.append(await self._measure('http chat', count, lambda: self._http_chat(
+                http_app, http_session, count
+            )))
+            results.append(await self._measure('http list_files', count, lambda: self._http_files(
+                http_app, http_session, count
+            )))
+            async with WebSocketClient(ws_session) as ws:
+                results.append(await self._measure('websocket chat (streamed)', count,
+                                                   lambda: ws.chat_many(count, stream=True)))
+                results.append(await self._measure('websocket chat', count,
+                                                   lambda: ws.chat_many(count, stream=False)))
+                results.append(await self._measure('websocket list_files', count,
+                                                   lambda: ws.list_files_many(count)))
+        finally:
+            history = get_history_backend()
+            for session_id in (http_session, ws_session):
+                await asyncio.to_thread(history.clear, session_id)
+        return results
+
+    async def _measure(self, name, count, run):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        await run()
+        return name, count, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    async def _http_chat(self, app, session_id, count):
+        for i in range(count):
+            body = json.dumps({'message': f'Benchmark message {i}', 'session_id': session_id})
+            status, _ = await http_request(app, 'POST', '/chatbot/chat/', body=body.encode())
+            if status != 200:
+                raise CommandError(f'POST /chatbot/chat/ returned {status}')
+
+    async def _http_files(self, app, session_id, count):
+        for _ in range(count):
+            status, _ = await http_request(app, 'GET', '/chatbot/files/', query=f'session_id={session_id}')
+            if status != 200:
+                raise CommandError(f'GET /chatbot/files/ returned {status}')
+
+
+async def http_request(app, method, path, body=b'', query=''):
+    """Send one request through an ASGI HTTP application and return (status, body)."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    status, chunks = None, []
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    disconnected.set()
+    return status, b''.join(chunks)
+
+
+class WebSocketClient:
+    """In-process client for the chat WebSocket ASGI application."""
+
+    def __init__(self, session_id, app=chat_websocket):
+        self.session_id = session_id
+        self.app = app
+        self.inbound = asyncio.Queue()
+        self.outbound = asyncio.Queue()
+
+    async def __aenter__(self):
+        scope = {
+            'type': 'websocket',
+            'path': '/chatbot/ws/',
+            'query_string': f'session_id={self.session_id}'.encode(),
+            'headers': [],
+        }
+        self.server = asyncio.create_task(
+            self.app(scope, self.inbound.get, self.outbound.put)
+        )
+        await self.inbound.put({'type': 'websocket.connect'})
+        accept = await self.outbound.get()
+        if accept['type'] != 'websocket.accept':
+            raise RuntimeError(f'WebSocket rejected: {accept}')
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+        await self.server
+
+    async def send_json(self, frame):
+        await self.inbound.put({'type': 'websocket.receive', 'text': json.dumps(frame)})
+
+    async def receive_json(self):
+        while True:
+            message = await self.outbound.get()
+            if message['type'] == 'websocket.send':
+                return json.loads(message['text'])
+            if message['type'] == 'websocket.close':
+                raise ConnectionError(f"Closed with code {message['code']}")
+
+    async def receive_until(self, frame_type):
+        """Return all frames up to and including the first one of frame_type."""
+        frames = []
+        while True:
+            frame = await self.receive_json()
+            frames.append(frame)
+            if frame['type'] == frame_type:
+                return frames
+
+    async def chat_many(self, count, stream=True):
+        for i in range(count):
+            await self.send_json({
+                'type': 'chat', 'id': str(i), 'message': f'Benchmark message {i}', 'stream': stream
+            })
+            await self.receive_until('done')
+
+    async def list_files_many(self, count):
+        for _ in range(count):
+            await self.send_json({'type': 'list_files'})
+            await self.receive_until('files')
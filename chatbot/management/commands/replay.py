@@ -0,0 +1,210 @@
+import contextlib
+import gzip
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+
+def read_records(paths):
+    """Yield captured requests one line at a time from JSONL (or .jsonl.gz) files."""
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ClientTarget:
+    """Sends requests to this project in-process through the Django test client."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, record):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+        method = record['method'].lower()
+        path = record['path']
+        if 'files' in record:
+            data = dict(record.get('form', {}))
+            for f in record['files']:
+                data.setdefault(f['field'], []).append(
+                    SimpleUploadedFile(f['name'], b'x' * f['size'], f['content_type'])
+                )
+            response = client.post(path, data)
+        elif 'json' in record:
+            response = getattr(client, method)(
+                path, data=json.dumps(record['json']), content_type='application/json'
+            )
+        else:
+            response = getattr(client, method)(path, record.get('query', {}))
+        return response.status_code
+
+
+class HTTPTarget:
+    """Sends requests to a running server over HTTP."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def send(self, record):
+        url = self.base_url + record['path']
+        query = record.get('query')
+        if query:
+            url += '?' + urllib.parse.urlencode(query)
+        headers, body = {}, None
+        if 'files' in record:
+            data = dict(record.get('form', {}))
+            for f in record['files']:
+                data.setdefault(f['field'], []).append(
+                    SimpleUploadedFile(f['name'], b'x' * f['size'], f['content_type'])
+                )
+            body = encode_multipart(BOUNDARY, data)
+            headers['Content-Type'] = MULTIPART_CONTENT
+        elif 'json' in record:
+            body = json.dumps(record['json']).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(url, data=body, headers=headers, method=record['method'])
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay traffic captured by TrafficCaptureMiddleware. Files are streamed "
+        "line by line, requests keep their original spacing (scaled by --speed), "
+        "and latency percentiles are reported per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Capture files (.jsonl or .jsonl.gz), oldest first')
+        parser.add_argument('--base-url',
+                            help='Replay against a running server instead of in-process')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Timing scale: 2 replays twice as fast, 0 sends as fast as possible')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of requests in flight at once (default: 4)')
+        parser.add_argument('--limit', type=int, help='Stop after this many requests')
+        parser.add_argument('--timeout', type=float, default=60.0,
+                            help='Per-request timeout in seconds for --base-url (default: 60)')
+
+    def handle(self, *args, **options):
+        if options['speed'] < 0:
+            raise CommandError('--speed must be zero or positive')
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        if options['base_url']:
+            target = HTTPTarget(options['base_url'], options['timeout'])
+            allowed_hosts = contextlib.nullcontext()
+        else:
+            target = ClientTarget()
+            # The test client sends Host: testserver
+            allowed_hosts = override_settings(ALLOWED_HOSTS=['testserver'])
+        with allowed_hosts:
+            stats = self.replay(
+                read_records(options['paths']), target,
+                options['speed'], options['concurrency'], options['limit']
+            )
+        self.report(stats)
+
+    def replay(self, records, target, speed, concurrency, limit=None):
+        # Bounded so the reader stays only a little ahead of the workers
+        pending = queue.Queue(maxsize=concurrency * 2)
+        latencies = defaultdict(list)
+        statuses = defaultdict(lambda: defaultdict(int))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                record = pending.get()
+                if record is None:
+                    return
+                key = f"{record['method']} {record['path']}"
+                started = time.perf_counter()
+                try:
+                    status = target.send(record)
+                except Exception as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies[key].append(elapsed)
+                    statuses[key][status] += 1
+
+        workers = [threading.Thread(target=work, daemon=True) for _ in range(concurrency)]
+        for worker in workers:
+            worker.start()
+
+        replay_start = time.perf_counter()
+        first_ts = None
+        sent = 0
+        for record in records:
+            if limit is not None and sent >= limit:
+                break
+            if speed > 0:
+                if first_ts is None:
+                    first_ts = record['ts']
+                delay = replay_start + (record['ts'] - first_ts) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pending.put(record)
+            sent += 1
+
+        for _ in workers:
+            pending.put(None)
+        for worker in workers:
+            worker.join()
+
+        return {
+            'sent': sent,
+            'elapsed': time.perf_counter() - replay_start,
+            'latencies': latencies,
+            'statuses': statuses,
+        }
+
+    def report(self, stats):
+        elapsed = stats['elapsed']
+        self.stdout.write(
+            f"Replayed {stats['sent']} requests in {elapsed:.2f}s "
+            f"({stats['sent'] / elapsed if elapsed else 0:.1f} req/s)"
+        )
+        self.stdout.write(
+            f"{'endpoint':<32}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses"
+        )
+        for key in sorted(stats['latencies']):
+            values = sorted(stats['latencies'][key])
+            statuses = ', '.join(
+                f'{status}: {count}' for status, count in sorted(stats['statuses'][key].items(), key=str)
+            )
+            self.stdout.write(
+                f"{key:<32}{len(values):>8}"
+                f"{percentile(values, 0.5) * 1000:>10.1f}"
+                f"{percentile(values, 0.9) * 1000:>10.1f}"
+                f"{percentile(values, 0.99) * 1000:>10.1f}"
+                f"{values[-1] * 1000:>10.1f}  {statuses}"
+            )
@@ -0,0 +1,112 @@
+import os
+import shutil
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.models import UploadedFile, sharded_path
+
+# Names already in the uploads/<xx>/<yy>/ layout. Legacy names that aren't
+# UUIDs shard on whatever characters they start with, so don't require hex.
+SHARDED_PATTERN = r'^uploads/[^/]{2}/[^/]{2}/[^/]+$'
+
+
+class Command(BaseCommand):
+    help = (
+        "Move uploads from the per-session layout (uploads/<session_id>/) to "
+        "the hash-sharded layout (uploads/<xx>/<yy>/). Safe to run while the "
+        "site is up and to interrupt: each file stays readable at its old path "
+        "until its row points at the new one, and a rerun skips files that "
+        "were already moved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows fetched per batch (default: 500)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches to limit I/O (default: 0)')
+        parser.add_argument('--limit', type=int,
+                            help='Stop after moving this many files')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many files would be moved')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        legacy = UploadedFile.objects.exclude(file__regex=SHARDED_PATTERN).order_by('pk')
+        if options['dry_run']:
+            self.stdout.write(f'{legacy.count()} files to move')
+            return
+
+        counts = {'moved': 0, 'missing': 0, 'changed': 0, 'in_place': 0}
+        last_pk = 0
+        limit = options['limit']
+        while limit is None or counts['moved'] < limit:
+            batch = list(
+                legacy.filter(pk__gt=last_pk).values_list('pk', 'file')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for pk, name in batch:
+                if limit is not None and counts['moved'] >= limit:
+                    break
+                counts[self.move(pk, name)] += 1
+            last_pk = batch[-1][0]
+            self.stdout.write(f"Moved {counts['moved']} files (up to id {last_pk})")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {counts['moved']} moved, {counts['missing']} missing on disk, "
+            f"{counts['changed']} changed while moving, {counts['in_place']} already in place"
+        ))
+
+    def move(self, pk, old_name):
+        """Move one file and repoint its row. Returns the counter to bump."""
+        new_name = sharded_path(os.path.basename(old_name))
+        if new_name == old_name:
+            # Deleting the "old" file would remove the only copy
+            return 'in_place'
+        if not default_storage.exists(old_name):
+            if not default_storage.exists(new_name):
+                return 'missing'
+            # An earlier run copied the file but stopped before updating the row
+        else:
+            self.copy(old_name, new_name)
+
+        # Only repoint the row if nobody changed or deleted it meanwhile
+        updated = UploadedFile.objects.filter(pk=pk, file=old_name).update(file=new_name)
+        if not updated:
+            default_storage.delete(new_name)
+            return 'changed'
+        default_storage.delete(old_name)
+        self.remove_empty_parent(old_name)
+        return 'moved'
+
+    def copy(self, old_name, new_name):
+        try:
+            old_path = default_storage.path(old_name)
+            new_path = default_storage.path(new_name)
+        except NotImplementedError:
+            # Remote storage: copy through the storage API
+            if not default_storage.exists(new_name):
+                with default_storage.open(old_name) as f:
+                    default_storage.save(new_name, f)
+            return
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        try:
+            # A hard link is a metadata-only copy on the same volume
+            os.link(old_path, new_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(old_path, new_path)
+
+    def remove_empty_parent(self, old_name):
+        try:
+            os.rmdir(os.path.dirname(default_storage.path(old_name)))
+        except (NotImplementedError, OSError):
+            # Remote storage, or the session folder still has other files
+            pass
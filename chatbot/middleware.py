@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import RawPostDataException
+
+DEFAULT_CONFIG = {
+    'ENABLED': False,
+    'PATH': None,
+    'MAX_BYTES': 50 * 1024 * 1024,
+    'BACKUP_COUNT': 10,
+    'PATH_PREFIXES': [
+        '/chatbot/chat/',
+        '/chatbot/jobs/',
+        '/chatbot/history/',
+        '/chatbot/upload/',
+        '/chatbot/upload-batch/',
+        '/chatbot/files/',
+        '/chatbot/delete-file/',
+        '/chatbot/clear/',
+        '/chatbot/fork/',
+    ],
+    'REDACT_FIELDS': ['message', 'filename'],
+    'PSEUDONYMIZE_FIELDS': ['session_id'],
+}
+
+REDACTED_FILENAME = 'redacted'
+
+
+def capture_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'TRAFFIC_CAPTURE', {})}
+
+
+class TrafficCaptureMiddleware:
+    """Append chat, upload and history requests to a rotating JSONL file.
+
+    Each line records when a request arrived, what was sent (with the
+    configured fields redacted and session IDs pseudonymized), and how the
+    app responded, so `manage.py replay` can reproduce the load. Uploaded
+    file contents are never captured, only their names, sizes and types.
+    """
+
+    def __init__(self, get_response):
+        config = capture_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.path_prefixes = tuple(config['PATH_PREFIXES'])
+        self.redact_fields = set(config['REDACT_FIELDS'])
+        self.pseudonymize_fields = set(config['PSEUDONYMIZE_FIELDS'])
+        # Salted so pseudonyms can't be reversed by hashing known session IDs
+        self.salt = settings.SECRET_KEY.encode()
+
+        path = config['PATH'] or os.path.join(settings.BASE_DIR, 'traffic', 'capture.jsonl')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=config['MAX_BYTES'], backupCount=config['BACKUP_COUNT'], encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger(f'{__name__}.capture.{path}')
+        self.logger.handlers = [handler]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def __call__(self, request):
+        if not request.path.startswith(self.path_prefixes):
+            return self.get_response(request)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        try:
+            record = self.build_record(request, response, started_at, duration)
+            self.logger.info(json.dumps(record, separators=(',', ':')))
+        except Exception:
+            logging.getLogger(__name__).exception("Failed to capture request to %s", request.path)
+        return response
+
+    def build_record(self, request, response, started_at, duration):
+        record = {
+            'ts': round(started_at, 6),
+            'method': request.method,
+            'path': request.path,
+            'query': self.scrub({k: request.GET.get(k) for k in request.GET}),
+            'content_type': request.content_type,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+        }
+        if request.content_type == 'multipart/form-data':
+            record['form'] = self.scrub({k: request.POST.get(k) for k in request.POST})
+            record['files'] = [
+                {
+                    'field': field,
+                    'name': self.scrub_filename(f.name),
+                    'size': f.size,
+                    'content_type': f.content_type,
+                }
+                for field, files in request.FILES.lists()
+                for f in files
+            ]
+        elif request.method in ('POST', 'PUT', 'PATCH'):
+            try:
+                body = request.body
+            except RawPostDataException:
+                body = b''
+            try:
+                record['json'] = self.scrub(json.loads(body))
+            except (ValueError, UnicodeDecodeError):
+                record['body_size'] = len(body)
+        return record
+
+    def scrub(self, value):
+        """Redact and pseudonymize configured keys anywhere in a JSON value."""
+        if isinstance(value, dict):
+            scrubbed = {}
+            for key, item in value.items():
+                if key in self.redact_fields and isinstance(item, str):
+                    # Keep the length so replayed payloads have the same size
+                    scrubbed[key] = 'x' * len(item)
+                elif key in self.pseudonymize_fields and isinstance(item, str) and item:
+                    scrubbed[key] = self.pseudonym(item)
+                else:
+                    scrubbed[key] = self.scrub(item)
+            return scrubbed
+        if isinstance(value, list):
+            return [self.scrub(item) for item in value]
+        return value
+
+    def scrub_filename(self, name):
+        if 'filename' not in self.redact_fields:
+            return name
+        return REDACTED_FILENAME + os.path.splitext(name)[1]
+
+    def pseudonym(self, value):
+        return hashlib.sha256(self.salt + value.encode()).hexdigest()[:32]
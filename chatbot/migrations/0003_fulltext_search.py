@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# External-content FTS5 indexes over message contents and file names. The
+# triggers keep them in sync with every insert, update and delete, including
+# bulk_create, so the index never needs a full rebuild after this migration.
+SQLITE_FORWARD = [
+    '''CREATE VIRTUAL TABLE chatbot_chatmessage_fts USING fts5(
+        content, content='chatbot_chatmessage', content_rowid='id', tokenize='unicode61'
+    )''',
+    '''CREATE TRIGGER chatbot_chatmessage_fts_insert AFTER INSERT ON chatbot_chatmessage BEGIN
+        INSERT INTO chatbot_chatmessage_fts(rowid, content) VALUES (new.id, new.content);
+    END''',
+    '''CREATE TRIGGER chatbot_chatmessage_fts_delete AFTER DELETE ON chatbot_chatmessage BEGIN
+        INSERT INTO chatbot_chatmessage_fts(chatbot_chatmessage_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END''',
+    '''CREATE TRIGGER chatbot_chatmessage_fts_update AFTER UPDATE OF content ON chatbot_chatmessage BEGIN
+        INSERT INTO chatbot_chatmessage_fts(chatbot_chatmessage_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO chatbot_chatmessage_fts(rowid, content) VALUES (new.id, new.content);
+    END''',
+    '''CREATE VIRTUAL TABLE chatbot_uploadedfile_fts USING fts5(
+        original_filename, content='chatbot_uploadedfile', content_rowid='id', tokenize='unicode61'
+    )''',
+    '''CREATE TRIGGER chatbot_uploadedfile_fts_insert AFTER INSERT ON chatbot_uploadedfile BEGIN
+        INSERT INTO chatbot_uploadedfile_fts(rowid, original_filename)
+        VALUES (new.id, new.original_filename);
+    END''',
+    '''CREATE TRIGGER chatbot_uploadedfile_fts_delete AFTER DELETE ON chatbot_uploadedfile BEGIN
+        INSERT INTO chatbot_uploadedfile_fts(chatbot_uploadedfile_fts, rowid, original_filename)
+        VALUES ('delete', old.id, old.original_filename);
+    END''',
+    '''CREATE TRIGGER chatbot_uploadedfile_fts_update AFTER UPDATE OF original_filename ON chatbot_uploadedfile BEGIN
+        INSERT INTO chatbot_uploadedfile_fts(chatbot_uploadedfile_fts, rowid, original_filename)
+        VALUES ('delete', old.id, old.original_filename);
+        INSERT INTO chatbot_uploadedfile_fts(rowid, original_filename)
+        VALUES (new.id, new.original_filename);
+    END''',
+    # Index rows that existed before this migration
+    "INSERT INTO chatbot_chatmessage_fts(chatbot_chatmessage_fts) VALUES ('rebuild')",
+    "INSERT INTO chatbot_uploadedfile_fts(chatbot_uploadedfile_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS chatbot_chatmessage_fts_insert',
+    'DROP TRIGGER IF EXISTS chatbot_chatmessage_fts_delete',
+    'DROP TRIGGER IF EXISTS chatbot_chatmessage_fts_update',
+    'DROP TABLE IF EXISTS chatbot_chatmessage_fts',
+    'DROP TRIGGER IF EXISTS chatbot_uploadedfile_fts_insert',
+    'DROP TRIGGER IF EXISTS chatbot_uploadedfile_fts_delete',
+    'DROP TRIGGER IF EXISTS chatbot_uploadedfile_fts_update',
+    'DROP TABLE IF EXISTS chatbot_uploadedfile_fts',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other databases use chatbot.search.SimpleSearchBackend (or their own backend)
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_chatsession_chatmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(SQLITE_FORWARD), run_on_sqlite(SQLITE_BACKWARD)),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:11
+
+from django.db import migrations, models
+
+
+def backfill_usage(apps, schema_editor):
+    from chatbot.usage import rebuild_usage
+
+    rebuild_usage(
+        apps.get_model('chatbot', 'UploadedFile'),
+        apps.get_model('chatbot', 'SessionStorageUsage'),
+        apps.get_model('chatbot', 'ContentTypeStorageUsage'),
+        apps.get_model('chatbot', 'DailyStorageUsage'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentTypeStorageUsage',
+            fields=[
+                ('content_type', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-total_bytes'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStorageUsage',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionStorageUsage',
+            fields=[
+                ('session_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(db_index=True, default=0)),
+            ],
+            options={
+                'ordering': ['-total_bytes'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['uploaded_at'], name='chatbot_upl_uploade_08f21e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['content_type', 'uploaded_at'], name='chatbot_upl_content_0a736a_idx'),
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:16
+
+import chatbot.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_storage_usage'),
+    ]
+
+    operations = [
+        # upload_to doesn't touch the schema, and altering the field on SQLite
+        # would rebuild the table and drop the full-text search triggers
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='uploadedfile',
+                    name='file',
+                    field=models.FileField(upload_to=chatbot.models.upload_to_sharded_folder),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_upload_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='fork_point',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='forks', to='chatbot.chatsession'),
+        ),
+    ]
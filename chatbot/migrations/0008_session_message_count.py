@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:37
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_message_count(apps, schema_editor):
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+    own_count = (
+        ChatMessage.objects.filter(session=OuterRef('pk')).order_by()
+        .values('session').annotate(n=Count('id')).values('n')
+    )
+    ChatSession.objects.update(message_count=F('fork_point') + Coalesce(Subquery(own_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_session_forks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_count, migrations.RunPython.noop),
+    ]
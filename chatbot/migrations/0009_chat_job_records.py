@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_session_message_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatJobRecord',
+            fields=[
+                ('id', models.CharField(max_length=36, primary_key=True, serialize=False)),
+                ('session_id', models.CharField(db_index=True, max_length=100)),
+                ('priority', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('response', models.TextField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('retryable', models.BooleanField(default=False)),
+                ('message_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+    ]
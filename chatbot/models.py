@@ -1,10 +1,15 @@
 from django.db import models
+from django.utils import timezone
 import os
 import uuid
 
 
 def upload_to_session_folder(instance, filename):
-    """Upload files to a folder based on session ID."""
+    """Upload files to a folder based on session ID.
+
+    Legacy layout, still referenced by migration 0001. New uploads use
+    upload_to_sharded_folder; `manage.py shard_media` moves old files over.
+    """
     # Get file extension
     ext = filename.split('.')[-1]
     # Create new filename using UUID
@@ -13,17 +18,41 @@ def upload_to_session_folder(instance, filename):
     return os.path.join('uploads', instance.session_id, filename)
 
 
+def sharded_path(filename):
+    """Return the upload path for a stored file name in the sharded layout.
+
+    Files fan out over two levels of 256 directories picked from the start
+    of their UUID name, e.g. uploads/3f/a2/3fa2...e1.pdf, so no directory
+    grows with the number of sessions.
+    """
+    return os.path.join('uploads', filename[:2], filename[2:4], filename)
+
+
+def upload_to_sharded_folder(instance, filename):
+    """Upload files to a hash-sharded folder under uploads/."""
+    ext = filename.split('.')[-1]
+    return sharded_path(f"{uuid.uuid4().hex}.{ext}")
+
+
 class UploadedFile(models.Model):
     """Model to store information about uploaded files."""
     session_id = models.CharField(max_length=100, db_index=True)
     original_filename = models.CharField(max_length=255)
-    file = models.FileField(upload_to=upload_to_session_folder)
+    file = models.FileField(upload_to=upload_to_sharded_folder)
     file_size = models.BigIntegerField()  # Size in bytes
     content_type = models.CharField(max_length=100)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the contents, set once image derivatives have been made;
+    # empty if the image could not be processed
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Admin date filtering and ordering
+            models.Index(fields=['uploaded_at']),
+            models.Index(fields=['content_type', 'uploaded_at']),
+        ]
     
     def __str__(self):
         return f"{self.original_filename} ({self.session_id[:8]}...)"
@@ -42,3 +71,100 @@ class UploadedFile(models.Model):
     def file_url(self):
         """Return the URL to access the file."""
         return self.file.url if self.file else None
+
+
+class ChatSession(models.Model):
+    """A persisted chat conversation, keyed by the client-side session ID."""
+    session_id = models.CharField(max_length=100, primary_key=True)
+    # A fork starts with the first fork_point messages of its parent's history,
+    # which are read from the parent rather than copied
+    parent = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='forks'
+    )
+    fork_point = models.PositiveIntegerField(default=0)
+    # Length of the whole history, inherited messages included; kept up to
+    # date by the history backend so forking doesn't have to count rows
+    message_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-updated_at']
+    
+    def __str__(self):
+        return f"Session {self.session_id[:8]}..."
+
+
+class ChatMessage(models.Model):
+    """A single message in a persisted chat conversation."""
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
+    role = models.CharField(max_length=20)
+    content = models.TextField()
+    file_info = models.JSONField(null=True, blank=True)
+    # Set when the message is appended, not when the write-behind buffer flushes
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        # Insertion order is conversation order
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.role}: {self.content[:50]}"
+    
+    def to_dict(self):
+        """Return the message in the format used by the chat history API."""
+        message = {"role": self.role, "content": self.content}
+        if self.file_info is not None:
+            message["file_info"] = self.file_info
+        return message
+
+
+class SessionStorageUsage(models.Model):
+    """Files and bytes currently stored for one chat session."""
+    session_id = models.CharField(max_length=100, primary_key=True)
+    file_count = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0, db_index=True)
+    
+    class Meta:
+        ordering = ['-total_bytes']
+
+
+class ContentTypeStorageUsage(models.Model):
+    """Files and bytes currently stored for one content type."""
+    content_type = models.CharField(max_length=100, primary_key=True)
+    file_count = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-total_bytes']
+
+
+class DailyStorageUsage(models.Model):
+    """Files and bytes currently stored that were uploaded on one (UTC) day."""
+    day = models.DateField(primary_key=True)
+    file_count = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day']
+
+
+class ChatJobRecord(models.Model):
+    """Status and result of a background chat job, readable by every worker.
+
+    The job itself runs in the process that accepted it; this row lets a
+    status poll that lands on another worker still find it.
+    """
+    id = models.CharField(max_length=36, primary_key=True)
+    session_id = models.CharField(max_length=100, db_index=True)
+    priority = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    response = models.TextField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    retryable = models.BooleanField(default=False)
+    message_count = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Job {self.id[:8]}... ({self.status})"
@@ -0,0 +1,235 @@
+import datetime
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+MESSAGES = 'messages'
+FILES = 'files'
+KINDS = (MESSAGES, FILES)
+
+# Full-text index tables, created and kept in sync by triggers in
+# migrations/0003_fulltext_search.py
+MESSAGE_INDEX = 'chatbot_chatmessage_fts'
+FILE_INDEX = 'chatbot_uploadedfile_fts'
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching all of its terms.
+
+    Each whitespace-separated term is quoted, so punctuation such as the
+    dash in an order number is matched literally rather than parsed as
+    query syntax.
+    """
+    terms = text.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class BaseSearchBackend:
+    """Interface for searching message contents and uploaded file names.
+
+    search() returns {"results": [...], "page": int, "has_next": bool}
+    with the best matches first.
+    """
+
+    def search(self, query, kind=MESSAGES, page=1, page_size=20):
+        offset = (page - 1) * page_size
+        # Fetch one extra row to know whether another page exists
+        if kind == MESSAGES:
+            rows = self.search_messages(query, offset, page_size + 1)
+        elif kind == FILES:
+            rows = self.search_files(query, offset, page_size + 1)
+        else:
+            raise ValueError(f'Unknown search type: {kind}')
+        return {
+            'results': rows[:page_size],
+            'page': page,
+            'has_next': len(rows) > page_size,
+        }
+
+    def search_messages(self, query, offset, limit):
+        raise NotImplementedError
+
+    def search_files(self, query, offset, limit):
+        raise NotImplementedError
+
+    def matching_session_ids(self, query, limit=1000):
+        """Return IDs of sessions with a message matching query, best first."""
+        raise NotImplementedError
+
+    def matching_file_ids(self, query, limit=1000):
+        """Return IDs of uploaded files whose name matches query, best first."""
+        raise NotImplementedError
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """Ranked search using the SQLite FTS5 indexes."""
+
+    def search_messages(self, query, offset, limit):
+        sql = f'''
+            SELECT m.id, m.session_id, m.role, m.created_at,
+                   snippet({MESSAGE_INDEX}, 0, '[', ']', '...', 12), {MESSAGE_INDEX}.rank
+            FROM {MESSAGE_INDEX}
+            JOIN chatbot_chatmessage m ON m.id = {MESSAGE_INDEX}.rowid
+            WHERE {MESSAGE_INDEX} MATCH %s
+            ORDER BY {MESSAGE_INDEX}.rank
+            LIMIT %s OFFSET %s
+        '''
+        return [
+            {
+                'id': row[0],
+                'session_id': row[1],
+                'role': row[2],
+                'created_at': _isoformat(row[3]),
+                'snippet': row[4],
+                'rank': row[5],
+            }
+            for row in self._fetch(sql, [fts_query(query), limit, offset])
+        ]
+
+    def search_files(self, query, offset, limit):
+        sql = f'''
+            SELECT f.id, f.session_id, f.original_filename, f.content_type, f.uploaded_at,
+                   {FILE_INDEX}.rank
+            FROM {FILE_INDEX}
+            JOIN chatbot_uploadedfile f ON f.id = {FILE_INDEX}.rowid
+            WHERE {FILE_INDEX} MATCH %s
+            ORDER BY {FILE_INDEX}.rank
+            LIMIT %s OFFSET %s
+        '''
+        return [
+            {
+                'id': row[0],
+                'session_id': row[1],
+                'filename': row[2],
+                'type': row[3],
+                'uploaded_at': _isoformat(row[4]),
+                'rank': row[5],
+            }
+            for row in self._fetch(sql, [fts_query(query), limit, offset])
+        ]
+
+    def matching_session_ids(self, query, limit=1000):
+        sql = f'''
+            SELECT m.session_id, MIN({MESSAGE_INDEX}.rank) AS best
+            FROM {MESSAGE_INDEX}
+            JOIN chatbot_chatmessage m ON m.id = {MESSAGE_INDEX}.rowid
+            WHERE {MESSAGE_INDEX} MATCH %s
+            GROUP BY m.session_id
+            ORDER BY best
+            LIMIT %s
+        '''
+        return [row[0] for row in self._fetch(sql, [fts_query(query), limit])]
+
+    def matching_file_ids(self, query, limit=1000):
+        sql = f'''
+            SELECT rowid FROM {FILE_INDEX}
+            WHERE {FILE_INDEX} MATCH %s
+            ORDER BY rank
+            LIMIT %s
+        '''
+        return [row[0] for row in self._fetch(sql, [fts_query(query), limit])]
+
+    def _fetch(self, sql, params):
+        if not params[0]:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Unranked substring search for databases without a full-text index."""
+
+    def _messages(self, query):
+        from .models import ChatMessage
+
+        messages = ChatMessage.objects.order_by('-id')
+        for term in query.split():
+            messages = messages.filter(content__icontains=term)
+        return messages
+
+    def _files(self, query):
+        from .models import UploadedFile
+
+        files = UploadedFile.objects.order_by('-id')
+        for term in query.split():
+            files = files.filter(original_filename__icontains=term)
+        return files
+
+    def search_messages(self, query, offset, limit):
+        return [
+            {
+                'id': m.id,
+                'session_id': m.session_id,
+                'role': m.role,
+                'created_at': m.created_at.isoformat(),
+                'snippet': m.content[:200],
+                'rank': None,
+            }
+            for m in self._messages(query)[offset:offset + limit]
+        ]
+
+    def search_files(self, query, offset, limit):
+        return [
+            {
+                'id': f.id,
+                'session_id': f.session_id,
+                'filename': f.original_filename,
+                'type': f.content_type,
+                'uploaded_at': f.uploaded_at.isoformat(),
+                'rank': None,
+            }
+            for f in self._files(query)[offset:offset + limit]
+        ]
+
+    def matching_session_ids(self, query, limit=1000):
+        session_ids = self._messages(query).values_list('session_id', flat=True)
+        return list(dict.fromkeys(session_ids[:limit]))
+
+    def matching_file_ids(self, query, limit=1000):
+        return list(self._files(query).values_list('id', flat=True)[:limit])
+
+
+def _isoformat(value):
+    # Raw SQLite queries return timestamps as naive UTC strings
+    if isinstance(value, str):
+        value = parse_datetime(value)
+        if settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+    return value.isoformat()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the search backend configured by settings.CHAT_SEARCH.
+
+    Defaults to FTS5 on SQLite and substring matching elsewhere.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                default = (
+                    'chatbot.search.SQLiteFTSSearchBackend' if connection.vendor == 'sqlite'
+                    else 'chatbot.search.SimpleSearchBackend'
+                )
+                config = getattr(settings, 'CHAT_SEARCH', {})
+                backend_class = import_string(config.get('BACKEND', default))
+                _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend(sender, setting, **kwargs):
+    global _backend
+    if setting == 'CHAT_SEARCH':
+        _backend = None
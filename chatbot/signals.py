@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .images import release_derivatives
+from .models import UploadedFile
+from .usage import record_usage
+
+
+@receiver(post_save, sender=UploadedFile)
+def add_upload_to_usage(sender, instance, created, **kwargs):
+    if created:
+        record_usage([instance])
+
+
+@receiver(post_delete, sender=UploadedFile)
+def remove_upload_from_usage(sender, instance, **kwargs):
+    record_usage([instance], sign=-1)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def remove_unused_derivatives(sender, instance, **kwargs):
+    release_derivatives(instance.content_hash)
@@ -0,0 +1,385 @@
+const chatMessages = document.getElementById('chatMessages');
+const chatInput = document.getElementById('chatInput');
+const sendButton = document.getElementById('sendButton');
+const typingIndicator = document.getElementById('typingIndicator');
+const clearChatButton = document.getElementById('clearChatButton');
+const fileInput = document.getElementById('fileInput');
+const uploadButton = document.getElementById('uploadButton');
+const uploadProgress = document.getElementById('uploadProgress');
+const uploadedFiles = document.getElementById('uploadedFiles');
+
+// Session ID issued by the server for this page
+const sessionId = document.querySelector('meta[name="session_id"]').content;
+
+// File upload event listeners
+uploadButton.addEventListener('click', () => fileInput.click());
+fileInput.addEventListener('change', handleFileUpload);
+
+// Auto-resize textarea
+chatInput.addEventListener('input', function() {
+    this.style.height = 'auto';
+    this.style.height = (this.scrollHeight) + 'px';
+});
+
+// Send message on Enter (but not Shift+Enter)
+chatInput.addEventListener('keydown', function(e) {
+    if (e.key === 'Enter' && !e.shiftKey) {
+        e.preventDefault();
+        sendMessage();
+    }
+});
+
+sendButton.addEventListener('click', sendMessage);
+clearChatButton.addEventListener('click', clearChat);
+
+// Persistent connection for chat turns and file-list updates.
+// The HTTP endpoints are used whenever it is not open.
+let socket = null;
+let socketRetryDelay = 1000;
+let pendingTurn = null;
+let turnCounter = 0;
+
+function connectSocket() {
+    if (!('WebSocket' in window)) return;
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    socket = new WebSocket(`${scheme}://${window.location.host}/chatbot/ws/?session_id=${sessionId}`);
+    socket.addEventListener('open', () => {
+        socketRetryDelay = 1000;
+    });
+    socket.addEventListener('message', event => handleSocketFrame(JSON.parse(event.data)));
+    socket.addEventListener('close', () => {
+        socket = null;
+        if (pendingTurn) {
+            pendingTurn = null;
+            typingIndicator.classList.remove('show');
+            addMessage('Sorry, there was a connection error. Please try again.', 'bot');
+            finishTurn();
+        }
+        setTimeout(connectSocket, socketRetryDelay);
+        socketRetryDelay = Math.min(socketRetryDelay * 2, 30000);
+    });
+}
+
+function socketOpen() {
+    return socket !== null && socket.readyState === WebSocket.OPEN;
+}
+
+function handleSocketFrame(frame) {
+    if (frame.type === 'ping') {
+        socket.send(JSON.stringify({ type: 'pong' }));
+    } else if (frame.type === 'files') {
+        renderFileList(frame.files);
+    } else if (pendingTurn && frame.id === pendingTurn.id) {
+        if (frame.type === 'delta') {
+            if (!pendingTurn.content) {
+                typingIndicator.classList.remove('show');
+                pendingTurn.content = addMessage('', 'bot');
+            }
+            pendingTurn.content.textContent += frame.delta;
+            scrollToBottom();
+        } else if (frame.type === 'done' || frame.type === 'error') {
+            typingIndicator.classList.remove('show');
+            const text = frame.type === 'done' ?
+                frame.response : 'Sorry, there was an error: ' + frame.error;
+            if (pendingTurn.content) {
+                pendingTurn.content.textContent = text;
+            } else {
+                addMessage(text, 'bot');
+            }
+            pendingTurn = null;
+            finishTurn();
+        }
+    }
+}
+
+function finishTurn() {
+    // Re-enable send button
+    sendButton.disabled = false;
+    chatInput.focus();
+}
+
+function handleFileUpload() {
+    const files = Array.from(fileInput.files);
+    if (!files.length) return;
+
+    // Validate file size
+    if (files.some(file => file.size > 10 * 1024 * 1024)) {
+        alert('File size must be less than 10MB');
+        fileInput.value = '';
+        return;
+    }
+
+    // All selected files go up in one request
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    formData.append('session_id', sessionId);
+
+    // Show progress
+    uploadProgress.classList.remove('d-none');
+    uploadButton.disabled = true;
+
+    fetch('/chatbot/upload-batch/', {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        uploadProgress.classList.add('d-none');
+        uploadButton.disabled = false;
+        fileInput.value = '';
+
+        if (data.error) {
+            alert('Upload error: ' + data.error);
+        } else {
+            // Add file messages to chat
+            data.uploaded.forEach(addFileMessage);
+            // The response already carries the updated list
+            renderFileList(data.files);
+        }
+        if (data.rejected && data.rejected.length) {
+            alert('Not uploaded:\n' + data.rejected.map(r => r.filename + ': ' + r.error).join('\n'));
+        }
+    })
+    .catch(error => {
+        uploadProgress.classList.add('d-none');
+        uploadButton.disabled = false;
+        fileInput.value = '';
+        alert('Upload failed: ' + error.message);
+    });
+}
+
+function addFileMessage(fileInfo) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message user file';
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.innerHTML = '<i class="fas fa-user"></i>';
+
+    const content = document.createElement('div');
+    content.className = 'message-content';
+    content.innerHTML = `
+        <div class="d-flex align-items-center">
+            <i class="fas fa-paperclip me-2"></i>
+            <div>
+                <strong>${fileInfo.filename}</strong>
+                <br><small class="text-muted">${fileInfo.size} • ${fileInfo.type}</small>
+            </div>
+        </div>
+    `;
+
+    messageDiv.appendChild(avatar);
+    messageDiv.appendChild(content);
+
+    chatMessages.appendChild(messageDiv);
+    scrollToBottom();
+}
+
+function loadUploadedFiles() {
+    fetch(`/chatbot/files/?session_id=${sessionId}`)
+    .then(response => response.json())
+    .then(data => renderFileList(data.files))
+    .catch(error => {
+        console.error('Error loading files:', error);
+    });
+}
+
+function renderFileList(files) {
+    if (files && files.length > 0) {
+        displayUploadedFiles(files);
+    } else {
+        uploadedFiles.innerHTML = '';
+    }
+}
+
+function displayUploadedFiles(files) {
+    uploadedFiles.innerHTML = files.map(file => `
+        <div class="uploaded-file">
+            <div class="file-info">
+                ${file.thumbnail_url ? `
+                <img class="file-thumbnail" src="${file.thumbnail_url}" alt="" loading="lazy">` : `
+                <div class="file-icon">
+                    <i class="fas fa-file"></i>
+                </div>`}
+                <div class="file-details">
+                    <div class="file-name">${file.filename}</div>
+                    <div class="file-meta">${file.size} • ${new Date(file.uploaded_at).toLocaleString()}</div>
+                </div>
+            </div>
+            <div class="file-actions">
+                <button class="btn btn-sm btn-outline-primary" onclick="window.open('${file.url}', '_blank')">
+                    <i class="fas fa-eye"></i>
+                </button>
+                <button class="btn btn-sm btn-outline-danger" onclick="deleteFile(${file.id})">
+                    <i class="fas fa-trash"></i>
+                </button>
+            </div>
+        </div>
+    `).join('');
+}
+
+function deleteFile(fileId) {
+    if (!confirm('Are you sure you want to delete this file?')) return;
+
+    fetch('/chatbot/delete-file/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: JSON.stringify({
+            file_id: fileId,
+            session_id: sessionId
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.status === 'success') {
+            if (!socketOpen()) loadUploadedFiles();
+        } else {
+            alert('Error deleting file: ' + data.error);
+        }
+    })
+    .catch(error => {
+        alert('Error deleting file: ' + error.message);
+    });
+}
+
+function sendMessage() {
+    const message = chatInput.value.trim();
+    if (!message) return;
+
+    // Add user message to chat
+    addMessage(message, 'user');
+
+    // Clear input and disable button
+    chatInput.value = '';
+    chatInput.style.height = 'auto';
+    sendButton.disabled = true;
+
+    // Show typing indicator
+    typingIndicator.classList.add('show');
+    scrollToBottom();
+
+    if (socketOpen()) {
+        pendingTurn = { id: String(++turnCounter), content: null };
+        socket.send(JSON.stringify({
+            type: 'chat',
+            id: pendingTurn.id,
+            message: message
+        }));
+        return;
+    }
+
+    // Send to backend with session ID
+    fetch('/chatbot/chat/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: JSON.stringify({ 
+            message: message,
+            session_id: sessionId
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        // Hide typing indicator
+        typingIndicator.classList.remove('show');
+
+        if (data.error) {
+            addMessage('Sorry, there was an error: ' + data.error, 'bot');
+        } else {
+            addMessage(data.response, 'bot');
+        }
+
+        finishTurn();
+    })
+    .catch(error => {
+        typingIndicator.classList.remove('show');
+        addMessage('Sorry, there was a connection error. Please try again.', 'bot');
+        finishTurn();
+    });
+}
+
+function clearChat() {
+    if (confirm('Are you sure you want to clear the chat history?')) {
+        fetch('/chatbot/clear/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify({ session_id: sessionId })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success') {
+                // Clear the chat messages except the initial bot message
+                chatMessages.innerHTML = `
+                    <div class="message bot">
+                        <div class="message-avatar">
+                            <i class="fas fa-robot"></i>
+                        </div>
+                        <div class="message-content">
+                            Hello! I'm your AI assistant. How can I help you today?
+                        </div>
+                    </div>
+                `;
+            }
+        })
+        .catch(error => {
+            console.error('Error clearing chat:', error);
+        });
+    }
+}
+
+function addMessage(text, sender) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${sender}`;
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.innerHTML = sender === 'user' ? 
+        '<i class="fas fa-user"></i>' : 
+        '<i class="fas fa-robot"></i>';
+
+    const content = document.createElement('div');
+    content.className = 'message-content';
+    content.textContent = text;
+
+    messageDiv.appendChild(avatar);
+    messageDiv.appendChild(content);
+
+    chatMessages.appendChild(messageDiv);
+    scrollToBottom();
+    return content;
+}
+
+function scrollToBottom() {
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Focus on input when page loads and load existing files
+chatInput.focus();
+loadUploadedFiles();
+connectSocket();
@@ -1,11 +1,56 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.core.management import call_command
 from django.urls import reverse
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync, sync_to_async
+import gzip
+import io
 import json
+import os
+import shutil
+import tempfile
 import uuid
-from .models import UploadedFile
+from unittest import mock
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, UPSTREAM_BREAKER, OPEN, HALF_OPEN, CLOSED
+from .jobs import BULK, INTERACTIVE, SUCCEEDED, FAILED, ChatJobQueue, QueueFullError, get_job_queue
+from .search import SimpleSearchBackend, fts_query, get_search_backend
+from .history import DatabaseHistoryBackend, MemoryHistoryBackend, get_history_backend
+from .management.commands.benchmark_transport import WebSocketClient
+from .models import (
+    ChatJobRecord, ChatMessage, ChatSession, ContentTypeStorageUsage, DailyStorageUsage,
+    SessionStorageUsage, UploadedFile,
+)
+from .uploads import type_error
+from .usage import rebuild_usage
+from .websocket import CLOSE_MISSING_SESSION, chat_websocket
 
 
+def tearDownModule():
+    # Write out buffered history while the test database still exists
+    get_history_backend().flush()
+
+
+# Resolve {% static %} without a collectstatic manifest
+PLAIN_STATIC_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class TempMediaMixin:
+    """Point MEDIA_ROOT at a temporary directory for each test."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
 class ChatbotViewsTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -17,6 +62,13 @@ class ChatbotViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'session_id')
 
+    def test_index_view_links_static_bundles(self):
+        """Test that the page shell loads its CSS and JavaScript from static files."""
+        response = self.client.get(reverse('chatbot:index'))
+        self.assertContains(response, '/static/chatbot/chat.css')
+        self.assertContains(response, '/static/chatbot/chat.js')
+        self.assertNotContains(response, '<style>')
+
     def test_chat_without_session_id(self):
         """Test that chat endpoint requires session ID."""
         response = self.client.post(
@@ -149,15 +201,26 @@ class ChatbotViewsTestCase(TestCase):
             content_type='application/json'
         )
         
-        response = self.client.get(reverse('chatbot:get_all_sessions'))
+        url = reverse('chatbot:get_all_sessions')
+        # Summaries include message text, so only staff may list them
+        self.assertEqual(self.client.get(url).status_code, 302)
+        
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.content)
         self.assertGreaterEqual(data['active_sessions'], 1)
         self.assertIn(self.session_id, data['sessions'])
+        self.assertEqual(data['sessions'][self.session_id]['message_count'], 2)
+        
+        response = self.client.get(url, {'page': 2, 'page_size': 1})
+        self.assertEqual(response.json()['page'], 2)
 
 
-class FileUploadTestCase(TestCase):
+class FileUploadTestCase(TempMediaMixin, TestCase):
     def setUp(self):
+        super().setUp()
         self.client = Client()
         self.session_id = str(uuid.uuid4())
 
@@ -280,3 +343,1048 @@ class FileUploadTestCase(TestCase):
         
         # Verify file was deleted from database
         self.assertEqual(UploadedFile.objects.filter(id=file_id).count(), 0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            'test', window_seconds=10, min_calls=4, failure_rate_threshold=0.5,
+            slow_call_seconds=5.0, slow_call_rate_threshold=0.75, open_seconds=30,
+            clock=self.clock
+        )
+
+    def test_opens_on_failure_rate(self):
+        """Test that the circuit opens once the failure rate crosses the threshold."""
+        self.breaker.record_success(0.1)
+        self.breaker.record_success(0.1)
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.assertEqual(self.breaker.snapshot()['rejected_calls'], 1)
+
+    def test_opens_on_slow_call_rate(self):
+        """Test that successful but slow calls also open the circuit."""
+        for _ in range(4):
+            self.breaker.record_success(6.0)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_window_expires_old_calls(self):
+        """Test that calls older than the window are not counted."""
+        self.breaker.record_failure(0.1)
+        self.breaker.record_failure(0.1)
+        self.clock.now += 11
+        self.breaker.record_success(0.1)
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()['calls_in_window'], 2)
+
+    def test_half_open_probe(self):
+        """Test that a single probe is admitted after the open period."""
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        """Test that a failed probe puts the circuit back in the open state."""
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 30
+        self.breaker.before_call()
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.snapshot()['times_opened'], 2)
+
+    def test_late_result_is_not_taken_as_probe(self):
+        """Test that a call admitted while closed can't close or reopen a half-open circuit."""
+        slow_call = self.breaker.before_call()
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 30
+        probe = self.breaker.before_call()
+        self.breaker.record_failure(0.1, slow_call)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_success(0.1, probe)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+@override_settings(OPENAI_API_KEY='test-key')
+class ChatCircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.session_id = str(uuid.uuid4())
+        UPSTREAM_BREAKER.reset()
+        for _ in range(UPSTREAM_BREAKER.min_calls):
+            UPSTREAM_BREAKER.record_failure(0.1)
+
+    def tearDown(self):
+        UPSTREAM_BREAKER.reset()
+
+    def test_chat_fails_fast_when_open(self):
+        """Test that chat returns a retryable 503 while the circuit is open."""
+        response = self.client.post(
+            reverse('chatbot:chat'),
+            data=json.dumps({
+                'message': 'Hello',
+                'session_id': self.session_id
+            }),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        data = json.loads(response.content)
+        self.assertTrue(data['retryable'])
+        self.assertEqual(get_history_backend().get_messages(self.session_id), [])
+
+    def test_upstream_status(self):
+        """Test that the breaker state is exposed for monitoring."""
+        response = self.client.get(reverse('chatbot:upstream_status'))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['state'], OPEN)
+        self.assertEqual(data['times_opened'], 1)
+
+
+class DatabaseHistoryBackendTestCase(TestCase):
+    def setUp(self):
+        self.backend = DatabaseHistoryBackend(flush_size=3, flush_interval=60, cache_ttl=60)
+        self.session_id = str(uuid.uuid4())
+
+    def test_appends_are_buffered_until_flush_size(self):
+        """Test that messages are written in one batch once flush_size is reached."""
+        self.assertEqual(self.backend.get_messages(self.session_id), [])
+        self.backend.append(self.session_id, {"role": "user", "content": "one"})
+        self.backend.append(self.session_id, {"role": "assistant", "content": "two"})
+        self.assertEqual(ChatMessage.objects.count(), 0)
+        self.assertEqual(len(self.backend.get_messages(self.session_id)), 2)
+
+        self.backend.append(self.session_id, {"role": "user", "content": "three"})
+        self.assertEqual(ChatMessage.objects.filter(session_id=self.session_id).count(), 3)
+        self.assertTrue(ChatSession.objects.filter(session_id=self.session_id).exists())
+
+    def test_history_is_shared_between_backends(self):
+        """Test that a second backend (another worker) reads flushed history."""
+        self.backend.append(
+            self.session_id,
+            {"role": "user", "content": "hello"},
+            {"role": "user", "content": "file", "file_info": {"id": 1}}
+        )
+        self.backend.flush()
+
+        other = DatabaseHistoryBackend()
+        messages = other.get_messages(self.session_id)
+        self.assertEqual(messages[0], {"role": "user", "content": "hello"})
+        self.assertEqual(messages[1]['file_info'], {"id": 1})
+
+    @override_settings(CHAT_HISTORY={
+        'BACKEND': 'chatbot.history.DatabaseHistoryBackend',
+        'OPTIONS': {'flush_size': 50, 'flush_interval': 60},
+    })
+    def test_chat_turn_is_visible_to_other_workers(self):
+        """Test that a chat turn is written by the end of its request, not on a later one."""
+        self.client.post(
+            reverse('chatbot:chat'),
+            data=json.dumps({'message': 'Hello', 'session_id': self.session_id}),
+            content_type='application/json'
+        )
+        other = DatabaseHistoryBackend()
+        self.assertEqual([m['role'] for m in other.get_messages(self.session_id)], ['user', 'assistant'])
+
+    def test_read_flushes_pending_writes_on_cache_miss(self):
+        """Test that reading an uncached session includes its buffered messages."""
+        self.backend.append(self.session_id, {"role": "user", "content": "hello"})
+        self.backend._cache.clear()
+        self.assertEqual(len(self.backend.get_messages(self.session_id)), 1)
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    def test_clear_drops_pending_and_stored_messages(self):
+        """Test that clearing a session removes buffered and persisted messages."""
+        self.backend.append(self.session_id, {"role": "user", "content": "a"})
+        self.backend.flush()
+        self.backend.append(self.session_id, {"role": "user", "content": "b"})
+        self.backend.clear(self.session_id)
+        self.backend.flush()
+        self.assertEqual(self.backend.get_messages(self.session_id), [])
+        self.assertFalse(ChatSession.objects.filter(session_id=self.session_id).exists())
+
+    def test_session_summaries(self):
+        """Test the per-session summary used by the sessions endpoint."""
+        self.backend.append(self.session_id, {"role": "user", "content": "hello"})
+        summaries = self.backend.session_summaries()
+        self.assertEqual(summaries[self.session_id]['message_count'], 1)
+
+
+class SessionForkTestCase(TestCase):
+    def messages(self, *contents):
+        return [{"role": "user", "content": c} for c in contents]
+
+    def check_forks(self, backend):
+        backend.append('root', *self.messages('a', 'b', 'c'))
+        self.assertEqual(backend.fork('root', 'fork', 2), 2)
+        self.assertEqual(backend.fork('fork', 'nested'), 2)
+        backend.append('root', *self.messages('d'))
+        backend.append('fork', *self.messages('x'))
+        backend.append('nested', *self.messages('y'))
+        contents = lambda sid: [m['content'] for m in backend.get_messages(sid)]
+        self.assertEqual(contents('root'), ['a', 'b', 'c', 'd'])
+        self.assertEqual(contents('fork'), ['a', 'b', 'x'])
+        self.assertEqual(contents('nested'), ['a', 'b', 'y'])
+        self.assertEqual(backend.session_summaries()['fork']['message_count'], 3)
+        with self.assertRaises(ValueError):
+            backend.fork('fork', 'too-far', 4)
+        with self.assertRaises(LookupError):
+            backend.fork('missing', 'other')
+
+        # Clearing the parent leaves its forks intact
+        backend.clear('root')
+        self.assertEqual(contents('root'), [])
+        self.assertEqual(contents('fork'), ['a', 'b', 'x'])
+        self.assertEqual(contents('nested'), ['a', 'b', 'y'])
+
+    def test_database_backend_forks(self):
+        """Test that database forks share their parent's rows until it is cleared."""
+        backend = DatabaseHistoryBackend(flush_size=100, flush_interval=60, cache_ttl=0)
+        self.check_forks(backend)
+        backend.flush()
+        self.assertEqual(ChatMessage.objects.filter(session_id='nested').count(), 1)
+        self.assertIsNone(ChatSession.objects.get(session_id='fork').parent_id)
+        self.assertEqual(ChatSession.objects.get(session_id='fork').message_count, 3)
+        # The stored count stands in for counting the parent's rows
+        with self.assertNumQueries(2):
+            backend.fork('fork', 'late', 3)
+
+    def test_memory_backend_forks(self):
+        """Test that in-memory forks share their parent's list until it is cleared."""
+        backend = MemoryHistoryBackend()
+        self.check_forks(backend)
+        self.assertEqual(len(backend.sessions['nested']), 1)
+
+    @override_settings(CHAT_HISTORY={'BACKEND': 'chatbot.history.MemoryHistoryBackend'})
+    def test_fork_endpoint(self):
+        """Test that the fork endpoint returns a new session starting at message N."""
+        session_id = str(uuid.uuid4())
+        get_history_backend().append(session_id, *self.messages('one', 'two', 'three'))
+        url = reverse('chatbot:fork_chat_session')
+        response = self.client.post(
+            url, data=json.dumps({'session_id': session_id, 'message_count': 1}),
+            content_type='application/json'
+        )
+        data = response.json()
+        self.assertEqual((data['parent_session_id'], data['message_count']), (session_id, 1))
+        history = self.client.get(reverse('chatbot:get_chat_history'), {'session_id': data['session_id']})
+        self.assertEqual(history.json()['chat_history'], self.messages('one'))
+
+        for body, status in (
+            ({'session_id': session_id, 'message_count': 9}, 400),
+            ({'session_id': session_id, 'message_count': '1'}, 400),
+            ({'session_id': 'missing'}, 404),
+        ):
+            response = self.client.post(url, data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, status)
+
+
+@override_settings(CHAT_HISTORY={'BACKEND': 'chatbot.history.MemoryHistoryBackend'})
+class MemoryHistoryBackendTestCase(TestCase):
+    def test_chat_uses_configured_backend(self):
+        """Test that views use the backend selected in settings."""
+        session_id = str(uuid.uuid4())
+        self.client.post(
+            reverse('chatbot:chat'),
+            data=json.dumps({'message': 'Hello', 'session_id': session_id}),
+            content_type='application/json'
+        )
+        backend = get_history_backend()
+        self.assertIsInstance(backend, MemoryHistoryBackend)
+        self.assertEqual(len(backend.sessions[session_id]), 2)
+        self.assertEqual(ChatMessage.objects.filter(session_id=session_id).count(), 0)
+
+
+class MemoryTieringTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.backend = MemoryHistoryBackend(compress_after=60, clock=self.clock)
+        self.long_reply = {"role": "assistant", "content": "All work and no play. " * 200}
+
+    def test_idle_sessions_are_compressed_and_inflated(self):
+        """Test that idle sessions move to the cold tier and come back unchanged on use."""
+        self.backend.append('idle', {"role": "user", "content": "hi"}, self.long_reply)
+        self.clock.now += 30
+        self.backend.append('active', {"role": "user", "content": "hello"})
+        self.clock.now += 40
+        self.backend.get_messages('active')
+        self.assertNotIn('idle', self.backend.sessions)
+        self.assertIn('active', self.backend.sessions)
+
+        stats = self.backend.memory_stats()
+        self.assertEqual((stats['hot_sessions'], stats['cold_sessions']), (1, 1))
+        self.assertGreater(stats['bytes_saved'], stats['cold_compressed_bytes'] * 10)
+        self.assertEqual(self.backend.session_summaries()['idle']['message_count'], 2)
+
+        self.assertEqual(self.backend.get_messages('idle')[1], self.long_reply)
+        self.backend.append('idle', {"role": "user", "content": "back again"})
+        self.assertEqual(len(self.backend.sessions['idle']), 3)
+        self.assertEqual(self.backend.memory_stats()['decompressions'], 1)
+
+    def test_forks_read_through_cold_parents(self):
+        """Test that a fork of a compressed session still sees the inherited messages."""
+        self.backend.append('root', {"role": "user", "content": "a"}, self.long_reply)
+        self.backend.fork('root', 'fork', 1)
+        self.clock.now += 120
+        self.backend.append('other', {"role": "user", "content": "b"})
+        self.assertEqual(self.backend.memory_stats()['cold_sessions'], 1)
+        self.assertEqual(self.backend.get_messages('fork'), [{"role": "user", "content": "a"}])
+
+
+    def test_compression_is_bounded_per_call(self):
+        """Test that a backlog of idle sessions is compressed a batch at a time."""
+        backend = MemoryHistoryBackend(compress_after=60, compress_batch=2, clock=self.clock)
+        for i in range(5):
+            backend.append(f'idle-{i}', self.long_reply)
+        self.clock.now += 120
+        backend.get_messages('missing')
+        self.assertEqual(backend.memory_stats()['cold_sessions'], 2)
+        backend.get_messages('missing')
+        backend.get_messages('missing')
+        self.assertEqual(backend.memory_stats()['cold_sessions'], 5)
+
+    def test_empty_forks_are_not_compressed(self):
+        """Test that a fork with no messages of its own stays summarised from its parent."""
+        self.backend.append('root', {"role": "user", "content": "a"})
+        self.backend.fork('root', 'fork')
+        self.backend.append('fork')
+        self.clock.now += 120
+        self.backend.get_messages('root')
+        self.assertNotIn('fork', self.backend._cold)
+        summaries = self.backend.session_summaries()
+        self.assertEqual(summaries['fork']['last_message'], summaries['root']['last_message'])
+
+
+class ChatWebSocketTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.session_id = str(uuid.uuid4())
+
+    def test_chat_turn_streams_deltas(self):
+        """Test that a chat turn streams deltas, then a done frame, and is saved."""
+        async def run():
+            async with WebSocketClient(self.session_id) as ws:
+                ready = await ws.receive_json()
+                await ws.send_json({'type': 'chat', 'id': 'a', 'message': 'Hello'})
+                return ready, await ws.receive_until('done')
+
+        ready, frames = async_to_sync(run)()
+        self.assertEqual(ready, {'type': 'ready', 'session_id': self.session_id})
+        deltas = [f['delta'] for f in frames if f['type'] == 'delta']
+        done = frames[-1]
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual(''.join(deltas), done['response'])
+        self.assertEqual(done['message_count'], 2)
+        history = get_history_backend().get_messages(self.session_id)
+        self.assertEqual(history[0]['content'], 'Hello')
+
+    def test_chat_without_message(self):
+        """Test that an empty chat frame returns an error frame."""
+        async def run():
+            async with WebSocketClient(self.session_id) as ws:
+                await ws.send_json({'type': 'chat', 'id': 'a', 'message': ''})
+                return await ws.receive_until('error')
+
+        frames = async_to_sync(run)()
+        self.assertIn('Message is required', frames[-1]['error'])
+
+    def test_history_error_sends_error_frame(self):
+        """Test that a failure loading history is reported to the client."""
+        async def run():
+            async with WebSocketClient(self.session_id) as ws:
+                await ws.send_json({'type': 'chat', 'id': 'a', 'message': 'Hello'})
+                return await ws.receive_until('error')
+
+        history = get_history_backend()
+        with mock.patch.object(history, 'get_messages', side_effect=RuntimeError('db down')):
+            frames = async_to_sync(run)()
+        self.assertEqual(frames[-1], {'type': 'error', 'id': 'a', 'error': 'db down', 'retryable': False})
+
+    def test_missing_session_id_is_rejected(self):
+        """Test that connections without a session ID are closed."""
+        async def run():
+            sent = []
+
+            async def receive():
+                return {'type': 'websocket.connect'}
+
+            async def send(message):
+                sent.append(message)
+
+            await chat_websocket({'type': 'websocket', 'query_string': b''}, receive, send)
+            return sent
+
+        sent = async_to_sync(run)()
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': CLOSE_MISSING_SESSION}])
+
+    def test_upload_notifies_file_list(self):
+        """Test that an HTTP upload pushes the new file list over the socket."""
+        async def run():
+            async with WebSocketClient(self.session_id) as ws:
+                await ws.receive_json()
+                test_file = SimpleUploadedFile("test.txt", b"test content", content_type="text/plain")
+                await sync_to_async(self.client.post)(
+                    reverse('chatbot:upload_file'),
+                    {'file': test_file, 'session_id': self.session_id}
+                )
+                return await ws.receive_until('files')
+
+        frames = async_to_sync(run)()
+        self.assertEqual(frames[-1]['count'], 1)
+        self.assertEqual(frames[-1]['files'][0]['filename'], 'test.txt')
+
+
+class StaticBundlesTestCase(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+
+    def collect(self):
+        with override_settings(STATIC_ROOT=self.static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as f:
+            return json.load(f)['paths']
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        """Test that bundles get content-hashed names and gzip variants."""
+        paths = self.collect()
+        hashed_js = paths['chatbot/chat.js']
+        self.assertNotEqual(hashed_js, 'chatbot/chat.js')
+        with open(os.path.join(self.static_root, hashed_js), 'rb') as f:
+            original = f.read()
+        with open(os.path.join(self.static_root, hashed_js + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+
+    def test_serve_hashed_file_with_long_cache(self):
+        """Test that hashed files are served compressed with immutable caching."""
+        from django.test import RequestFactory
+        from mysite import staticfiles
+
+        hashed_js = self.collect()['chatbot/chat.js']
+        request = RequestFactory().get('/static/' + hashed_js, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        staticfiles.hashed_names.cache_clear()
+        self.addCleanup(staticfiles.hashed_names.cache_clear)
+        with override_settings(STATIC_ROOT=self.static_root):
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            staticfiles_storage._setup()
+            response = staticfiles.serve(request, hashed_js)
+            response.close()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+
+class ChatJobQueueTestCase(TestCase):
+    def setUp(self):
+        self.ran = []
+        self.queue = ChatJobQueue(self.run_job, workers=2, reserved_interactive_workers=1, max_queued=2)
+
+    def run_job(self, job):
+        self.ran.append(job.message)
+        if job.message == 'fail':
+            raise ValueError('boom')
+        return f'reply to {job.message}', 2
+
+    def test_interactive_jobs_run_first(self):
+        """Test that interactive jobs are taken before earlier bulk jobs."""
+        self.queue.submit('s', 'bulk', BULK)
+        self.queue.submit('s', 'interactive', INTERACTIVE)
+        self.queue.process_one(block=False)
+        self.queue.process_one(block=False)
+        self.assertEqual(self.ran, ['interactive', 'bulk'])
+
+    def test_bulk_jobs_leave_reserved_workers_free(self):
+        """Test that bulk jobs cannot take the worker reserved for interactive chats."""
+        self.queue.submit('s', 'bulk 1', BULK)
+        self.queue.submit('s', 'bulk 2', BULK)
+        running = self.queue._take(block=False)
+        self.assertEqual(running.message, 'bulk 1')
+        self.assertIsNone(self.queue._take(block=False))
+        self.queue.submit('s', 'interactive', INTERACTIVE)
+        self.assertEqual(self.queue._take(block=False).message, 'interactive')
+
+    def test_job_results(self):
+        """Test that finished jobs record their response or error."""
+        ok = self.queue.submit('s', 'hello')
+        failed = self.queue.submit('s', 'fail')
+        self.queue.process_one(block=False)
+        self.queue.process_one(block=False)
+        self.assertTrue(ok.done.is_set())
+        self.assertEqual(ok.to_dict()['status'], SUCCEEDED)
+        self.assertEqual(ok.to_dict()['response'], 'reply to hello')
+        self.assertEqual(failed.to_dict()['status'], FAILED)
+        self.assertEqual(failed.to_dict()['error'], 'boom')
+
+    def test_lanes_are_bounded(self):
+        """Test that a full lane rejects new jobs."""
+        self.queue.submit('s', 'a', BULK)
+        self.queue.submit('s', 'b', BULK)
+        with self.assertRaises(QueueFullError):
+            self.queue.submit('s', 'c', BULK)
+        self.queue.submit('s', 'd', INTERACTIVE)
+
+
+@override_settings(CHAT_JOBS={'WORKERS': 0})
+class ChatJobViewsTestCase(TestCase):
+    def setUp(self):
+        self.session_id = str(uuid.uuid4())
+
+    def submit(self, **data):
+        return self.client.post(
+            reverse('chatbot:submit_chat_job'),
+            data=json.dumps({'session_id': self.session_id, **data}),
+            content_type='application/json'
+        )
+
+    def test_submit_and_poll(self):
+        """Test that a submitted job returns immediately and its result can be polled."""
+        response = self.submit(message='Hello')
+        self.assertEqual(response.status_code, 202)
+        data = json.loads(response.content)
+        self.assertEqual(data['status'], 'queued')
+
+        get_job_queue().process_one(block=False)
+
+        status = self.client.get(data['status_url'], {'wait': 1})
+        status_data = json.loads(status.content)
+        self.assertEqual(status_data['status'], SUCCEEDED)
+        self.assertEqual(status_data['message_count'], 2)
+        history = get_history_backend().get_messages(self.session_id)
+        self.assertEqual(history[1]['content'], status_data['response'])
+
+    def test_poll_on_another_worker(self):
+        """Test that a job's status can be read by a worker that didn't accept it."""
+        queued = self.submit(message='Hello').json()
+        done = self.submit(message='Again').json()
+        get_job_queue().process_one(block=False)
+        get_job_queue().process_one(block=False)
+        pending = self.submit(message='Later').json()
+
+        # A new queue stands in for another worker process
+        with override_settings(CHAT_JOBS={'WORKERS': 0, 'MAX_WAIT': 0.1, 'POLL_INTERVAL': 0.05}):
+            status = self.client.get(done['status_url'], {'wait': 1}).json()
+            self.assertEqual(status['status'], SUCCEEDED)
+            self.assertEqual(status['message_count'], 4)
+            self.assertEqual(self.client.get(queued['status_url']).json()['status'], SUCCEEDED)
+            status = self.client.get(pending['status_url'], {'wait': 1}).json()
+            self.assertEqual(status, {
+                'job_id': pending['job_id'], 'session_id': self.session_id,
+                'priority': INTERACTIVE, 'status': 'queued',
+            })
+        self.assertEqual(ChatJobRecord.objects.filter(session_id=self.session_id).count(), 3)
+
+    def test_submit_invalid_priority(self):
+        """Test that unknown priority lanes are rejected."""
+        response = self.submit(message='Hello', priority='urgent')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_job(self):
+        """Test that polling an unknown job returns 404."""
+        response = self.client.get(reverse('chatbot:chat_job_status', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class SearchTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True, is_superuser=True)
+        self.session_id = str(uuid.uuid4())
+        backend = DatabaseHistoryBackend()
+        backend.append(
+            self.session_id,
+            {"role": "user", "content": "Where is my order A-12345?"},
+            {"role": "assistant", "content": "Let me look that up for you."}
+        )
+        backend.append(str(uuid.uuid4()), {"role": "user", "content": "Unrelated question"})
+        backend.flush()
+        UploadedFile.objects.create(
+            session_id=self.session_id,
+            original_filename='invoice march.pdf',
+            file='uploads/x/invoice.pdf',
+            file_size=10,
+            content_type='application/pdf'
+        )
+
+    def test_fts_query_quotes_terms(self):
+        """Test that user input is quoted so punctuation is not query syntax."""
+        self.assertEqual(fts_query('order A-12345'), '"order" "A-12345"')
+        self.assertEqual(fts_query('say "hi"'), '"say" """hi"""')
+
+    def test_search_messages(self):
+        """Test ranked message search through the FTS index."""
+        results = get_search_backend().search('A-12345')
+        self.assertEqual(len(results['results']), 1)
+        self.assertEqual(results['results'][0]['session_id'], self.session_id)
+        self.assertIn('[A-12345]', results['results'][0]['snippet'])
+        self.assertFalse(results['has_next'])
+
+    def test_search_pagination(self):
+        """Test that results are split into pages."""
+        backend = DatabaseHistoryBackend()
+        for i in range(3):
+            backend.append(str(uuid.uuid4()), {"role": "user", "content": f"refund request {i}"})
+        backend.flush()
+        first = get_search_backend().search('refund', page_size=2)
+        second = get_search_backend().search('refund', page=2, page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertTrue(first['has_next'])
+        self.assertEqual(len(second['results']), 1)
+        self.assertFalse(second['has_next'])
+
+    def test_index_follows_deletes(self):
+        """Test that deleted messages and files drop out of the index."""
+        ChatSession.objects.filter(session_id=self.session_id).delete()
+        UploadedFile.objects.filter(session_id=self.session_id).delete()
+        self.assertEqual(get_search_backend().search('A-12345')['results'], [])
+        self.assertEqual(get_search_backend().search('invoice', kind='files')['results'], [])
+
+    def test_simple_backend_matches(self):
+        """Test the substring fallback backend."""
+        backend = SimpleSearchBackend()
+        self.assertEqual(backend.matching_session_ids('a-12345'), [self.session_id])
+        self.assertEqual(len(backend.search('invoice', kind='files')['results']), 1)
+
+    def test_search_view_requires_staff(self):
+        """Test that conversation search is limited to staff."""
+        response = self.client.get(reverse('chatbot:search'), {'q': 'order'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_search_view(self):
+        """Test the search API for messages and files."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('chatbot:search'), {'q': 'invoice', 'type': 'files'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['results'][0]['filename'], 'invoice march.pdf')
+
+    def test_admin_search_uses_index(self):
+        """Test that the admin search boxes find sessions and files by content."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin:chatbot_chatsession_changelist'), {'q': 'A-12345'})
+        self.assertContains(response, self.session_id)
+        self.assertContains(response, '1 result')
+        response = self.client.get(reverse('admin:chatbot_uploadedfile_changelist'), {'q': 'march'})
+        self.assertContains(response, 'invoice march.pdf')
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class StorageUsageTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True, is_superuser=True)
+        self.session_id = str(uuid.uuid4())
+
+    def create_file(self, size, content_type='text/plain', session_id=None):
+        return UploadedFile.objects.create(
+            session_id=session_id or self.session_id,
+            original_filename='file.txt',
+            file='uploads/x/file.txt',
+            file_size=size,
+            content_type=content_type
+        )
+
+    def test_rollups_follow_uploads_and_deletes(self):
+        """Test that per-session, per-type and per-day totals are kept up to date."""
+        first = self.create_file(100)
+        self.create_file(50, 'application/pdf')
+        session = SessionStorageUsage.objects.get(session_id=self.session_id)
+        self.assertEqual((session.file_count, session.total_bytes), (2, 150))
+        text = ContentTypeStorageUsage.objects.get(content_type='text/plain')
+        self.assertEqual((text.file_count, text.total_bytes), (1, 100))
+        day = DailyStorageUsage.objects.get()
+        self.assertEqual((day.file_count, day.total_bytes), (2, 150))
+
+        first.delete()
+        session.refresh_from_db()
+        self.assertEqual((session.file_count, session.total_bytes), (1, 50))
+        self.assertFalse(ContentTypeStorageUsage.objects.filter(content_type='text/plain').exists())
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """Test that recomputing the rollups gives the same totals."""
+        self.create_file(100)
+        self.create_file(25, session_id='other')
+        before = list(SessionStorageUsage.objects.order_by('session_id').values_list())
+        rebuild_usage(UploadedFile, SessionStorageUsage, ContentTypeStorageUsage, DailyStorageUsage)
+        after = list(SessionStorageUsage.objects.order_by('session_id').values_list())
+        self.assertEqual(before, after)
+        self.assertEqual(DailyStorageUsage.objects.get().file_count, 2)
+
+    def test_storage_usage_dashboard(self):
+        """Test that the admin dashboard shows the rollup totals."""
+        self.create_file(2048)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin:chatbot_uploadedfile_storage_usage'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_files'], 1)
+        self.assertContains(response, self.session_id)
+
+    def test_changelist_keyset_pagination(self):
+        """Test that changelist pages continue below the last ID of the previous page."""
+        from .admin import UploadedFileAdmin
+
+        files = [self.create_file(1) for _ in range(5)]
+        self.client.force_login(self.staff)
+        url = reverse('admin:chatbot_uploadedfile_changelist')
+        with mock.patch.object(UploadedFileAdmin, 'list_per_page', 2):
+            first = self.client.get(url)
+            second = self.client.get(url, {'before': files[3].pk})
+        self.assertEqual(first.context['cl'].result_count, 5)
+        self.assertEqual([f.pk for f in first.context['cl'].result_list], [files[4].pk, files[3].pk])
+        self.assertIn(f'before={files[3].pk}', first.context['keyset_next_url'])
+        self.assertEqual([f.pk for f in second.context['cl'].result_list], [files[2].pk, files[1].pk])
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class TrafficCaptureTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'capture.jsonl')
+
+    def read_capture(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_capture_redacts_and_pseudonymizes(self):
+        """Test that captured requests keep their shape but not their content."""
+        session_id = str(uuid.uuid4())
+        with override_settings(TRAFFIC_CAPTURE={'ENABLED': True, 'PATH': self.path}):
+            client = Client()
+            client.post(
+                reverse('chatbot:chat'),
+                data=json.dumps({'message': 'secret plans', 'session_id': session_id}),
+                content_type='application/json'
+            )
+            client.post(reverse('chatbot:upload_file'), {
+                'file': SimpleUploadedFile('passport.pdf', b'%PDF-1.4 data', 'application/pdf'),
+                'session_id': session_id,
+            })
+            client.get(reverse('chatbot:index'))
+        chat, upload = self.read_capture()
+        self.assertEqual(chat['json']['message'], 'x' * len('secret plans'))
+        self.assertEqual(len(chat['json']['session_id']), 32)
+        self.assertNotEqual(chat['json']['session_id'], session_id)
+        self.assertEqual(upload['form']['session_id'], chat['json']['session_id'])
+        self.assertEqual(upload['files'], [{
+            'field': 'file', 'name': 'redacted.pdf', 'size': 13, 'content_type': 'application/pdf'
+        }])
+        self.assertEqual(upload['status'], 200)
+
+    @override_settings(CHAT_HISTORY={'BACKEND': 'chatbot.history.MemoryHistoryBackend'})
+    def test_replay_reports_per_endpoint(self):
+        """Test that the replay command sends every captured request and reports latency."""
+        records = [
+            {'ts': 100.0 + i / 100, 'method': 'POST', 'path': '/chatbot/chat/',
+             'json': {'message': 'xxxx', 'session_id': 'a' * 32}}
+            for i in range(3)
+        ] + [{'ts': 100.05, 'method': 'GET', 'path': '/chatbot/history/',
+              'query': {'session_id': 'a' * 32}}]
+        with open(self.path, 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        out = io.StringIO()
+        # As configured outside the test runner, which allows testserver
+        with override_settings(ALLOWED_HOSTS=[]):
+            call_command('replay', self.path, '--speed', '0', '--concurrency', '2', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Replayed 4 requests', output)
+        self.assertRegex(output, r'POST /chatbot/chat/\s+3 .*200: 3')
+        self.assertRegex(output, r'GET /chatbot/history/\s+1 .*200: 1')
+
+
+class ShardedMediaTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.session_id = str(uuid.uuid4())
+
+    def test_new_uploads_are_sharded(self):
+        """Test that uploads land two hash-prefix levels below uploads/."""
+        self.client.post(reverse('chatbot:upload_file'), {
+            'file': SimpleUploadedFile('notes.txt', b'hello', 'text/plain'),
+            'session_id': self.session_id,
+        })
+        name = UploadedFile.objects.get(session_id=self.session_id).file.name
+        self.assertRegex(name, r'^uploads/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.txt$')
+        self.assertEqual(name.split('/')[1:3], [name.split('/')[3][:2], name.split('/')[3][2:4]])
+
+    def test_shard_media_moves_legacy_files(self):
+        """Test that the migration command moves files, repoints rows and can be rerun."""
+        legacy = []
+        for i in range(3):
+            name = f'uploads/{self.session_id}/{uuid.uuid4()}.txt'
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'data %d' % i)
+            legacy.append(UploadedFile.objects.create(
+                session_id=self.session_id, original_filename=f'{i}.txt',
+                file=name, file_size=6, content_type='text/plain'
+            ))
+        # Names that aren't UUIDs shard on non-hex characters: uploads/no/te/
+        name = f'uploads/{self.session_id}/notes.txt'
+        path = os.path.join(self.media_root, name)
+        with open(path, 'wb') as f:
+            f.write(b'notes')
+        notes = UploadedFile.objects.create(
+            session_id=self.session_id, original_filename='notes.txt',
+            file=name, file_size=5, content_type='text/plain'
+        )
+        # A row whose file is already gone is reported, not moved
+        UploadedFile.objects.create(
+            session_id=self.session_id, original_filename='gone.txt',
+            file=f'uploads/{self.session_id}/gone.txt', file_size=1, content_type='text/plain'
+        )
+
+        out = io.StringIO()
+        call_command('shard_media', '--batch-size', '2', '--limit', '2', stdout=out)
+        self.assertIn('2 moved', out.getvalue())
+        call_command('shard_media', stdout=out)
+        self.assertIn('2 moved, 1 missing', out.getvalue())
+        # A third run must leave the non-hex name alone
+        out = io.StringIO()
+        call_command('shard_media', stdout=out)
+        self.assertIn('0 moved, 1 missing', out.getvalue())
+        notes.refresh_from_db()
+        self.assertEqual(notes.file.name, 'uploads/no/te/notes.txt')
+        with notes.file.open('rb') as f:
+            self.assertEqual(f.read(), b'notes')
+
+        for i, upload in enumerate(legacy):
+            upload.refresh_from_db()
+            self.assertRegex(upload.file.name, r'^uploads/[0-9a-f]{2}/[0-9a-f]{2}/')
+            with upload.file.open('rb') as f:
+                self.assertEqual(f.read(), b'data %d' % i)
+        # Only the missing file's row still points into the session folder
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'uploads', self.session_id)))
+        out = io.StringIO()
+        call_command('shard_media', '--dry-run', stdout=out)
+        self.assertIn('1 files to move', out.getvalue())
+
+
+@override_settings(CHAT_IMAGES={'WORKERS': 0, 'MODEL_MAX_SIDE': 64, 'THUMBNAIL_SIZE': 16})
+class ImageDerivativeTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.session_id = str(uuid.uuid4())
+
+    def upload_image(self, name='photo.png', mode='RGBA', size=(300, 200)):
+        from PIL import Image
+
+        data = io.BytesIO()
+        Image.new(mode, size, (255, 0, 0, 128)[:len(mode)]).save(data, 'PNG')
+        response = self.client.post(reverse('chatbot:upload_file'), {
+            'file': SimpleUploadedFile(name, data.getvalue(), 'image/png'),
+            'session_id': self.session_id,
+        })
+        return UploadedFile.objects.get(id=response.json()['file_info']['id'])
+
+    def test_upload_creates_shared_derivatives(self):
+        """Test that images get a bounded model JPEG and a thumbnail, shared by content."""
+        from PIL import Image
+        from .images import MODEL, THUMBNAIL, derivative_name
+
+        first = self.upload_image()
+        second = self.upload_image('copy.png')
+        self.assertIsNotNone(first.content_hash)
+        self.assertEqual(first.content_hash, second.content_hash)
+        with default_storage.open(derivative_name(first.content_hash, MODEL)) as f:
+            model_image = Image.open(f)
+            self.assertEqual((model_image.format, model_image.size), ('JPEG', (64, 43)))
+            self.assertNotIn('exif', model_image.info)
+        files = self.client.get(reverse('chatbot:list_files'), {'session_id': self.session_id}).json()['files']
+        self.assertTrue(files[0]['thumbnail_url'].endswith(f'{first.content_hash}-thumb.webp'))
+
+        # Derivatives stay while any upload with the same contents remains
+        first.delete()
+        self.assertTrue(default_storage.exists(derivative_name(second.content_hash, THUMBNAIL)))
+        second.delete()
+        self.assertFalse(default_storage.exists(derivative_name(second.content_hash, THUMBNAIL)))
+        self.assertFalse(default_storage.exists(derivative_name(second.content_hash, MODEL)))
+
+    def test_model_input_attaches_derivative(self):
+        """Test that chat history sent to the model carries the derivative, not the original."""
+        from .images import model_input
+
+        upload = self.upload_image()
+        messages = get_history_backend().get_messages(self.session_id)
+        messages.append({'role': 'user', 'content': 'What is in this picture?'})
+        converted = model_input(messages)
+        text, image = converted[0]['content']
+        self.assertEqual(text['type'], 'input_text')
+        self.assertTrue(image['image_url'].startswith('data:image/jpeg;base64,'))
+        self.assertNotIn('file_info', converted[0])
+        self.assertEqual(converted[1], {'role': 'user', 'content': 'What is in this picture?'})
+        self.assertLess(len(image['image_url']), upload.file_size * 2)
+
+    def test_missing_derivative_is_recreated(self):
+        """Test that a chat turn remakes a model image deleted from storage."""
+        from .images import MODEL, _data_url, derivative_name, model_input
+
+        upload = self.upload_image()
+        default_storage.delete(derivative_name(upload.content_hash, MODEL))
+        _data_url.cache_clear()
+        converted = model_input(get_history_backend().get_messages(self.session_id))
+        self.assertEqual(converted[0]['content'][1]['type'], 'input_image')
+        self.assertTrue(default_storage.exists(derivative_name(upload.content_hash, MODEL)))
+
+    def test_failed_image_is_not_retried(self):
+        """Test that an image that can't be decoded is skipped on later turns."""
+        from . import images
+
+        self.client.post(reverse('chatbot:upload_file'), {
+            'file': SimpleUploadedFile('broken.png', b'not a png', 'image/png'),
+            'session_id': self.session_id,
+        })
+        upload = UploadedFile.objects.get(session_id=self.session_id)
+        self.assertEqual(upload.content_hash, images.FAILED)
+        messages = get_history_backend().get_messages(self.session_id)
+        with mock.patch.object(images, 'ensure_derivatives') as ensure:
+            converted = images.model_input(messages)
+        ensure.assert_not_called()
+        self.assertEqual(converted[0]['content'], messages[0]['content'])
+
+    def test_release_restores_derivatives_claimed_meanwhile(self):
+        """Test that deleting derivatives doesn't strand an upload that just recorded the hash."""
+        from .images import MODEL, derivative_name, release_derivatives
+
+        upload = self.upload_image()
+        content_hash = upload.content_hash
+        UploadedFile.objects.filter(pk=upload.pk).update(content_hash=None)
+        delete = default_storage.delete
+
+        def delete_while_recorded(name):
+            # Another worker records the hash between the check and the delete
+            UploadedFile.objects.filter(pk=upload.pk).update(content_hash=content_hash)
+            delete(name)
+
+        with mock.patch.object(default_storage, 'delete', side_effect=delete_while_recorded):
+            release_derivatives(content_hash)
+        self.assertTrue(default_storage.exists(derivative_name(content_hash, MODEL)))
+
+    def test_non_images_are_not_processed(self):
+        """Test that other uploads get no hash or thumbnail."""
+        self.client.post(reverse('chatbot:upload_file'), {
+            'file': SimpleUploadedFile('notes.txt', b'hello', 'text/plain'),
+            'session_id': self.session_id,
+        })
+        upload = UploadedFile.objects.get(session_id=self.session_id)
+        self.assertIsNone(upload.content_hash)
+        response = self.client.get(reverse('chatbot:list_files'), {'session_id': self.session_id})
+        self.assertIsNone(response.json()['files'][0]['thumbnail_url'])
+
+
+@override_settings(CHAT_HISTORY={'BACKEND': 'chatbot.history.MemoryHistoryBackend'})
+class BatchUploadTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.session_id = str(uuid.uuid4())
+
+    def upload(self, *files):
+        return self.client.post(reverse('chatbot:upload_files'), {
+            'files': list(files),
+            'session_id': self.session_id,
+        })
+
+    def test_batch_upload(self):
+        """Test that valid files are stored together and invalid ones are reported."""
+        with mock.patch('chatbot.uploads.MAX_UPLOAD_SIZE', 100):
+            response = self.upload(
+                SimpleUploadedFile('a.txt', b'alpha', 'text/plain'),
+                SimpleUploadedFile('b.csv', b'x,y', 'text/csv'),
+                SimpleUploadedFile('big.txt', b'x' * 200, 'text/plain'),
+                SimpleUploadedFile('run.exe', b'MZ', 'application/x-msdownload'),
+            )
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f['filename'] for f in data['uploaded']], ['a.txt', 'b.csv'])
+        self.assertEqual(
+            [(r['filename'], r['error']) for r in data['rejected']],
+            [('big.txt', 'File size exceeds 10MB limit'), ('run.exe', type_error('application/x-msdownload'))]
+        )
+        self.assertEqual(data['count'], 2)
+        self.assertEqual({f['filename'] for f in data['files']}, {'a.txt', 'b.csv'})
+
+        with UploadedFile.objects.get(original_filename='a.txt').file.open('rb') as f:
+            self.assertEqual(f.read(), b'alpha')
+        usage = SessionStorageUsage.objects.get(session_id=self.session_id)
+        self.assertEqual((usage.file_count, usage.total_bytes), (2, 8))
+        history = get_history_backend().get_messages(self.session_id)
+        self.assertEqual(len(history), 1)
+        self.assertEqual([f['filename'] for f in history[0]['file_info']['files']], ['a.txt', 'b.csv'])
+        self.assertTrue(history[0]['content'].startswith('📎 Uploaded 2 files: '))
+
+    def test_single_file_batch_message(self):
+        """Test that a batch of one file is described in the singular."""
+        response = self.upload(SimpleUploadedFile('a.txt', b'alpha', 'text/plain'))
+        self.assertEqual(response.json()['message'], '1 file uploaded successfully')
+        history = get_history_backend().get_messages(self.session_id)
+        self.assertTrue(history[0]['content'].startswith('📎 Uploaded 1 file: a.txt'))
+
+    def test_disallowed_file_after_accepted_one(self):
+        """Test that rejecting a file doesn't close the one accepted before it."""
+        for max_memory_size in (2621440, 0):  # in memory, then temporary files
+            with self.subTest(max_memory_size=max_memory_size), \
+                    override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=max_memory_size):
+                response = self.upload(
+                    SimpleUploadedFile('a.txt', b'alpha', 'text/plain'),
+                    SimpleUploadedFile('run.exe', b'MZ', 'application/x-msdownload'),
+                    SimpleUploadedFile('empty.exe', b'', 'application/x-msdownload'),
+                )
+                data = response.json()
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([f['filename'] for f in data['uploaded']], ['a.txt'])
+                self.assertEqual([r['filename'] for r in data['rejected']], ['run.exe', 'empty.exe'])
+                with UploadedFile.objects.get(id=data['uploaded'][0]['id']).file.open('rb') as f:
+                    self.assertEqual(f.read(), b'alpha')
+
+    def test_batch_upload_rejects_empty_and_oversized_batches(self):
+        """Test the errors for batches with no valid files or too many files."""
+        response = self.upload(SimpleUploadedFile('run.exe', b'MZ', 'application/x-msdownload'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['rejected'][0]['filename'], 'run.exe')
+        with override_settings(CHAT_UPLOADS={'MAX_BATCH_FILES': 1}), \
+                mock.patch('chatbot.uploads.type_error', wraps=type_error) as check:
+            response = self.upload(
+                SimpleUploadedFile('a.txt', b'a', 'text/plain'),
+                SimpleUploadedFile('b.txt', b'b', 'text/plain'),
+                SimpleUploadedFile('c.txt', b'c', 'text/plain'),
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'At most 1 file can be uploaded at once')
+        # Parsing stopped at the file over the limit
+        self.assertEqual(check.call_count, 1)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    def test_failed_insert_removes_stored_files(self):
+        """Test that files written to storage are deleted if the rows can't be created."""
+        with mock.patch.object(UploadedFile.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            response = self.upload(SimpleUploadedFile('a.txt', b'a', 'text/plain'))
+        self.assertEqual(response.status_code, 500)
+        stored = [files for _, _, files in os.walk(self.media_root) if files]
+        self.assertEqual(stored, [])
@@ -0,0 +1,162 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from .models import UploadedFile, upload_to_sharded_folder
+from .usage import record_usage
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
+ALLOWED_UPLOAD_TYPES = [
+    'text/plain', 'text/csv', 'application/pdf',
+    'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'application/json', 'text/markdown'
+]
+
+DEFAULT_CONFIG = {
+    'MAX_BATCH_FILES': 20,
+    'WRITE_WORKERS': 4,
+}
+
+
+def upload_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_UPLOADS', {})}
+
+
+def size_error(size):
+    if size > MAX_UPLOAD_SIZE:
+        return 'File size exceeds 10MB limit'
+    return None
+
+
+def type_error(content_type):
+    if content_type not in ALLOWED_UPLOAD_TYPES:
+        return (f'File type {content_type} not allowed. '
+                f'Allowed types: {", ".join(ALLOWED_UPLOAD_TYPES)}')
+    return None
+
+
+class ValidatingUploadHandler(FileUploadHandler):
+    """Drop disallowed or oversized files while the request body streams in.
+
+    Installed ahead of Django's own handlers, so a rejected file is never
+    buffered in memory or written to a temporary file. Rejections are kept
+    in ``rejected`` as {"filename": ..., "error": ...}. If more than
+    ``max_files`` files arrive, parsing stops and ``too_many`` is set.
+    """
+
+    def __init__(self, request=None, max_files=None):
+        super().__init__(request)
+        self.max_files = max_files
+        self.rejected = []
+        self.received = 0
+        self.file_count = 0
+        self.too_many = False
+        self.pending_error = None
+
+    def new_file(self, field_name, file_name, content_type, content_length,
+                 charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length,
+                         charset, content_type_extra)
+        self.received = 0
+        self.file_count += 1
+        if self.max_files is not None and self.file_count > self.max_files:
+            self.too_many = True
+            # Read past the rest of the body without storing anything
+            raise StopUpload(connection_reset=False)
+        # SkipFile can't be raised here: Django would close the handlers'
+        # files before their new_file runs, i.e. the previous accepted file
+        self.pending_error = type_error(content_type)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.reject_if(self.pending_error)
+        self.received += len(raw_data)
+        self.reject_if(size_error(self.received))
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.pending_error:
+            # An empty file sends no chunks; the view drops it by type
+            self.rejected.append({'filename': self.file_name, 'error': self.pending_error})
+            self.pending_error = None
+        return None
+
+    def reject_if(self, error):
+        if error:
+            self.rejected.append({'filename': self.file_name, 'error': error})
+            self.pending_error = None
+            raise SkipFile
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=upload_config()['WRITE_WORKERS'], thread_name_prefix='chat-uploads'
+                )
+    return _executor
+
+
+def save_uploads(session_id, uploaded_files):
+    """Store several uploaded files and record them in one transaction.
+
+    Files are written to storage in parallel on a bounded pool, then all
+    rows are inserted with a single bulk_create. If anything fails, the
+    files written so far are removed. Returns the new UploadedFile objects.
+    """
+    instances = [
+        UploadedFile(
+            session_id=session_id,
+            original_filename=f.name,
+            file_size=f.size,
+            content_type=f.content_type
+        )
+        for f in uploaded_files
+    ]
+    futures = [
+        get_executor().submit(
+            default_storage.save, upload_to_sharded_folder(instance, f.name), f
+        )
+        for instance, f in zip(instances, uploaded_files)
+    ]
+    saved = []
+    error = None
+    for instance, future in zip(instances, futures):
+        try:
+            instance.file.name = future.result()
+            saved.append(instance.file.name)
+        except Exception as e:
+            error = error or e
+
+    try:
+        if error is not None:
+            raise error
+        with transaction.atomic():
+            instances = UploadedFile.objects.bulk_create(instances)
+            # bulk_create doesn't send post_save, so update the rollups here
+            record_usage(instances)
+    except Exception:
+        for name in saved:
+            default_storage.delete(name)
+        raise
+    return instances
+
+
+@receiver(setting_changed)
+def _reset_executor(sender, setting, **kwargs):
+    global _executor
+    if setting == 'CHAT_UPLOADS':
+        _executor = None
@@ -6,10 +6,16 @@ app_name = 'chatbot'
 urlpatterns = [
     path('', views.index, name='index'),
     path('chat/', views.chat, name='chat'),
+    path('jobs/', views.submit_chat_job, name='submit_chat_job'),
+    path('jobs/<str:job_id>/', views.chat_job_status, name='chat_job_status'),
     path('history/', views.get_chat_history, name='get_chat_history'),
     path('clear/', views.clear_chat_history, name='clear_chat_history'),
+    path('fork/', views.fork_chat_session, name='fork_chat_session'),
     path('sessions/', views.get_all_sessions, name='get_all_sessions'),
+    path('search/', views.search, name='search'),
+    path('upstream-status/', views.upstream_status, name='upstream_status'),
     path('upload/', views.upload_file, name='upload_file'),
+    path('upload-batch/', views.upload_files, name='upload_files'),
     path('files/', views.list_files, name='list_files'),
     path('delete-file/', views.delete_file, name='delete_file'),
 ]
@@ -0,0 +1,81 @@
+from collections import defaultdict
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def _day(uploaded_at):
+    """Return the UTC calendar day of an upload timestamp."""
+    if uploaded_at.tzinfo is not None:
+        uploaded_at = uploaded_at.astimezone(datetime.timezone.utc)
+    return uploaded_at.date()
+
+
+def _increment(model, key_field, deltas):
+    """Add (file_count, total_bytes) deltas to rollup rows, creating them as needed."""
+    for key, (count, size) in deltas.items():
+        if not count and not size:
+            continue
+        rows = model.objects.filter(**{key_field: key})
+        updated = rows.update(file_count=F('file_count') + count, total_bytes=F('total_bytes') + size)
+        if updated:
+            if count < 0:
+                # Don't keep empty rows around for sessions that are gone
+                rows.filter(file_count__lte=0).delete()
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**{key_field: key}, file_count=count, total_bytes=size)
+        except IntegrityError:
+            # Another request created the row first
+            rows.update(file_count=F('file_count') + count, total_bytes=F('total_bytes') + size)
+
+
+def record_usage(files, sign=1):
+    """Update the storage rollups for files added (sign=1) or removed (sign=-1)."""
+    from .models import ContentTypeStorageUsage, DailyStorageUsage, SessionStorageUsage
+
+    by_session = defaultdict(lambda: [0, 0])
+    by_type = defaultdict(lambda: [0, 0])
+    by_day = defaultdict(lambda: [0, 0])
+    for f in files:
+        for totals, key in (
+            (by_session, f.session_id),
+            (by_type, f.content_type),
+            (by_day, _day(f.uploaded_at)),
+        ):
+            totals[key][0] += sign
+            totals[key][1] += sign * f.file_size
+
+    with transaction.atomic():
+        _increment(SessionStorageUsage, 'session_id', by_session)
+        _increment(ContentTypeStorageUsage, 'content_type', by_type)
+        _increment(DailyStorageUsage, 'day', by_day)
+
+
+def rebuild_usage(UploadedFile, SessionStorageUsage, ContentTypeStorageUsage, DailyStorageUsage):
+    """Recompute all rollups from the UploadedFile table.
+
+    Takes the model classes so it also works with historical models in
+    migrations.
+    """
+    files = UploadedFile.objects.order_by()
+    with transaction.atomic():
+        for model, key_field, rows in (
+            (SessionStorageUsage, 'session_id', files.values('session_id')),
+            (ContentTypeStorageUsage, 'content_type', files.values('content_type')),
+            (DailyStorageUsage, 'day', files.annotate(
+                day=TruncDate('uploaded_at', tzinfo=datetime.timezone.utc)
+            ).values('day')),
+        ):
+            model.objects.all().delete()
+            model.objects.bulk_create(
+                [
+                    model(**{key_field: row[key_field]},
+                          file_count=row['file_count'], total_bytes=row['total_bytes'])
+                    for row in rows.annotate(file_count=Count('id'), total_bytes=Sum('file_size'))
+                ],
+                batch_size=1000
+            )
@@ -1,17 +1,25 @@
 from django.shortcuts import render
+from django.template.defaultfilters import pluralize
+from django.urls import reverse
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.files.storage import default_storage
 from django.conf import settings
 import json
+import time
 import uuid
 import os
+from . import events, images
+from .circuit_breaker import UPSTREAM_BREAKER, CircuitOpenError
+from .history import get_history_backend
+from .search import KINDS, MESSAGES, get_search_backend
+from .jobs import LANES, INTERACTIVE, QueueFullError, get_job_queue, job_status
 from .models import UploadedFile
-
-# In-memory storage for chat sessions
-# Structure: {session_id: [{"role": "user/assistant", "content": "message"}, ...]}
-CHAT_SESSIONS = {}
+from .uploads import (
+    ValidatingUploadHandler, save_uploads, size_error, type_error, upload_config,
+)
 
 def index(request):
     """Main chatbot interface."""
@@ -20,6 +28,128 @@ def index(request):
     context = {'session_id': session_id}
     return render(request, 'chatbot/index.html', context)
 
+
+def mock_response(messages, user_message):
+    """Return the placeholder reply used when no OpenAI API key is configured."""
+    return f"""This is a mock response to: "{user_message}"
+
+To enable real ChatGPT responses:
+1. Install the OpenAI package: pip install openai
+2. Get an API key from OpenAI (https://platform.openai.com/api-keys)
+3. Add OPENAI_API_KEY = 'your-api-key-here' to your Django settings.py
+
+Chat history for this session: {len(messages)} messages
+For now, I'm just echoing your message back with some helpful information!"""
+
+
+def generate_response(messages, user_message):
+    """Return the assistant reply to user_message, the last entry of messages.
+
+    Raises CircuitOpenError without contacting the upstream model while
+    the circuit breaker is open.
+    """
+    # Check if OpenAI API key is configured
+    openai_api_key = getattr(settings, 'OPENAI_API_KEY', None)
+    
+    if not openai_api_key:
+        return mock_response(messages, user_message)
+    
+    try:
+        from openai import OpenAI
+    except ImportError:
+        return "OpenAI package is not installed. Please install it with: pip install openai"
+    
+    model_messages = images.model_input(messages)
+    ticket = UPSTREAM_BREAKER.before_call()
+    started = time.monotonic()
+    try:
+        client = OpenAI(
+            api_key=openai_api_key,
+            timeout=getattr(settings, 'OPENAI_TIMEOUT', 30.0),
+            # One attempt per call, so the breaker times and counts what callers wait for
+            max_retries=0,
+        )
+        
+        response = client.responses.create(
+            model="gpt-4.1-nano",
+            input=model_messages,
+        )
+        
+        ai_response = response.output_text
+    except Exception as e:
+        UPSTREAM_BREAKER.record_failure(time.monotonic() - started, ticket)
+        return f"OpenAI API error: {str(e)}"
+    
+    UPSTREAM_BREAKER.record_success(time.monotonic() - started, ticket)
+    return ai_response
+
+
+def stream_response(messages, user_message):
+    """Yield the assistant reply to user_message in pieces as it is generated.
+
+    Raises CircuitOpenError before yielding anything while the circuit
+    breaker is open.
+    """
+    openai_api_key = getattr(settings, 'OPENAI_API_KEY', None)
+    
+    if not openai_api_key:
+        # Stream the mock reply in small pieces so clients exercise the same path
+        text = mock_response(messages, user_message)
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+        return
+    
+    try:
+        from openai import OpenAI
+    except ImportError:
+        yield "OpenAI package is not installed. Please install it with: pip install openai"
+        return
+    
+    model_messages = images.model_input(messages)
+    ticket = UPSTREAM_BREAKER.before_call()
+    started = time.monotonic()
+    # Latency is measured to the first delta so slow readers don't trip the breaker
+    first_delta_after = None
+    try:
+        client = OpenAI(
+            api_key=openai_api_key,
+            timeout=getattr(settings, 'OPENAI_TIMEOUT', 30.0),
+            # One attempt per call, so the breaker times and counts what callers wait for
+            max_retries=0,
+        )
+        stream = client.responses.create(
+            model="gpt-4.1-nano",
+            input=model_messages,
+            stream=True,
+        )
+        for event in stream:
+            if event.type == 'response.output_text.delta':
+                if first_delta_after is None:
+                    first_delta_after = time.monotonic() - started
+                yield event.delta
+    except Exception as e:
+        UPSTREAM_BREAKER.record_failure(time.monotonic() - started, ticket)
+        yield f"OpenAI API error: {str(e)}"
+        return
+    except GeneratorExit:
+        # The client went away mid-stream; the upstream itself was healthy
+        UPSTREAM_BREAKER.record_success(first_delta_after or time.monotonic() - started, ticket)
+        raise
+    
+    UPSTREAM_BREAKER.record_success(first_delta_after or time.monotonic() - started, ticket)
+
+
+def circuit_open_response(error):
+    """Build the 503 response returned while the upstream circuit is open."""
+    response = JsonResponse({
+        'error': str(error),
+        'retryable': True,
+        'retry_after': round(error.retry_after, 1)
+    }, status=503)
+    response['Retry-After'] = str(max(1, int(error.retry_after + 0.5)))
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def chat(request):
@@ -35,54 +165,19 @@ def chat(request):
         if not session_id:
             return JsonResponse({'error': 'Session ID is required'}, status=400)
         
-        # Initialize session if it doesn't exist
-        if session_id not in CHAT_SESSIONS:
-            CHAT_SESSIONS[session_id] = []
+        history = get_history_backend()
         
-        # Add user message to chat history
-        CHAT_SESSIONS[session_id].append({
-            "role": "user",
-            "content": user_message
-        })
+        # Prepare messages for OpenAI API (include chat history)
+        user_entry = {"role": "user", "content": user_message}
+        messages = history.get_messages(session_id) + [user_entry]
         
-        # Check if OpenAI API key is configured
-        openai_api_key = getattr(settings, 'OPENAI_API_KEY', None)
-        
-        if openai_api_key:
-            # Try to use OpenAI API if key is available
-            try:
-                from openai import OpenAI
-
-                client = OpenAI(api_key=openai_api_key)
-
-                # Prepare messages for OpenAI API (include chat history)
-                messages = CHAT_SESSIONS[session_id].copy()
-                
-                response = client.responses.create(
-                    model="gpt-4.1-nano",
-                    input=messages,
-                )
-                
-                ai_response = response.output_text
-                
-            except ImportError:
-                ai_response = "OpenAI package is not installed. Please install it with: pip install openai"
-            except Exception as e:
-                ai_response = f"OpenAI API error: {str(e)}"
-        else:
-            # Return a mock response with instructions
-            ai_response = f"""This is a mock response to: "{user_message}"
-
-To enable real ChatGPT responses:
-1. Install the OpenAI package: pip install openai
-2. Get an API key from OpenAI (https://platform.openai.com/api-keys)
-3. Add OPENAI_API_KEY = 'your-api-key-here' to your Django settings.py
-
-Chat history for this session: {len(CHAT_SESSIONS[session_id])} messages
-For now, I'm just echoing your message back with some helpful information!"""
+        try:
+            ai_response = generate_response(messages, user_message)
+        except CircuitOpenError as e:
+            return circuit_open_response(e)
         
-        # Add AI response to chat history
-        CHAT_SESSIONS[session_id].append({
+        # Add both turns to chat history together
+        history.append(session_id, user_entry, {
             "role": "assistant", 
             "content": ai_response
         })
@@ -91,7 +186,7 @@ For now, I'm just echoing your message back with some helpful information!"""
             'response': ai_response,
             'status': 'success',
             'session_id': session_id,
-            'message_count': len(CHAT_SESSIONS[session_id])
+            'message_count': len(messages) + 1
         })
         
     except json.JSONDecodeError:
@@ -100,6 +195,62 @@ For now, I'm just echoing your message back with some helpful information!"""
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def submit_chat_job(request):
+    """Queue a chat message and return a job ID without waiting for the reply."""
+    try:
+        data = json.loads(request.body)
+        user_message = data.get('message', '').strip()
+        session_id = data.get('session_id', '')
+        priority = data.get('priority', INTERACTIVE)
+        
+        if not user_message:
+            return JsonResponse({'error': 'Message is required'}, status=400)
+        
+        if not session_id:
+            return JsonResponse({'error': 'Session ID is required'}, status=400)
+        
+        if priority not in LANES:
+            return JsonResponse({
+                'error': f'Priority must be one of: {", ".join(LANES)}'
+            }, status=400)
+        
+        try:
+            job = get_job_queue().submit(session_id, user_message, priority)
+        except QueueFullError as e:
+            response = JsonResponse({'error': str(e), 'retryable': True}, status=429)
+            response['Retry-After'] = '5'
+            return response
+        
+        return JsonResponse({
+            **job.to_dict(),
+            'status_url': reverse('chatbot:chat_job_status', args=[job.id])
+        }, status=202)
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def chat_job_status(request, job_id):
+    """Return the state of a chat job, optionally waiting up to ?wait= seconds for it to finish."""
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return JsonResponse({'error': 'wait must be a number of seconds'}, status=400)
+    
+    status = job_status(job_id, wait)
+    
+    if status is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    
+    return JsonResponse(status)
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_chat_history(request):
@@ -109,7 +260,7 @@ def get_chat_history(request):
     if not session_id:
         return JsonResponse({'error': 'Session ID is required'}, status=400)
     
-    chat_history = CHAT_SESSIONS.get(session_id, [])
+    chat_history = get_history_backend().get_messages(session_id)
     
     return JsonResponse({
         'chat_history': chat_history,
@@ -129,8 +280,7 @@ def clear_chat_history(request):
         if not session_id:
             return JsonResponse({'error': 'Session ID is required'}, status=400)
         
-        if session_id in CHAT_SESSIONS:
-            del CHAT_SESSIONS[session_id]
+        get_history_backend().clear(session_id)
         
         return JsonResponse({
             'status': 'success',
@@ -145,22 +295,106 @@ def clear_chat_history(request):
 
 
 @csrf_exempt
+@require_http_methods(["POST"])
+def fork_chat_session(request):
+    """Start a new session that branches off an existing one."""
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id', '')
+        message_count = data.get('message_count')
+        
+        if not session_id:
+            return JsonResponse({'error': 'Session ID is required'}, status=400)
+        
+        if message_count is not None and (
+                not isinstance(message_count, int) or isinstance(message_count, bool)):
+            return JsonResponse({'error': 'message_count must be an integer'}, status=400)
+        
+        new_session_id = str(uuid.uuid4())
+        try:
+            message_count = get_history_backend().fork(session_id, new_session_id, message_count)
+        except LookupError:
+            return JsonResponse({'error': 'Session not found'}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        return JsonResponse({
+            'status': 'success',
+            'session_id': new_session_id,
+            'parent_session_id': session_id,
+            'message_count': message_count
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@staff_member_required
 @require_http_methods(["GET"])
 def get_all_sessions(request):
-    """Get information about all active sessions (for debugging)."""
-    sessions_info = {}
-    for session_id, messages in CHAT_SESSIONS.items():
-        sessions_info[session_id] = {
-            'message_count': len(messages),
-            'last_message': messages[-1]['content'][:50] + '...' if messages else 'No messages'
-        }
+    """Get a page of active sessions, most recent first (staff only, for debugging)."""
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+        page_size = min(100, max(1, int(request.GET.get('page_size', 20))))
+    except ValueError:
+        return JsonResponse({'error': 'page and page_size must be integers'}, status=400)
+    
+    history = get_history_backend()
+    # Fetch one extra session to know whether another page exists
+    sessions_info = history.session_summaries((page - 1) * page_size, page_size + 1)
+    has_next = len(sessions_info) > page_size
+    sessions_info = dict(list(sessions_info.items())[:page_size])
+    
+    return JsonResponse({
+        'active_sessions': len(sessions_info),
+        'sessions': sessions_info,
+        'page': page,
+        'has_next': has_next,
+        'memory': history.memory_stats()
+    })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def search(request):
+    """Full-text search over chat messages or uploaded file names (staff only)."""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('type', MESSAGES)
+    
+    if not query:
+        return JsonResponse({'error': 'Search query is required'}, status=400)
+    
+    if kind not in KINDS:
+        return JsonResponse({'error': f'type must be one of: {", ".join(KINDS)}'}, status=400)
+    
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+        page_size = min(100, max(1, int(request.GET.get('page_size', 20))))
+    except ValueError:
+        return JsonResponse({'error': 'page and page_size must be integers'}, status=400)
+    
+    # Make buffered messages searchable
+    get_history_backend().flush()
+    
+    results = get_search_backend().search(query, kind, page, page_size)
     
     return JsonResponse({
-        'active_sessions': len(CHAT_SESSIONS),
-        'sessions': sessions_info
+        **results,
+        'query': query,
+        'type': kind,
+        'page_size': page_size
     })
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def upstream_status(request):
+    """Expose the upstream circuit breaker state for monitoring."""
+    return JsonResponse(UPSTREAM_BREAKER.snapshot())
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def upload_file(request):
@@ -176,24 +410,10 @@ def upload_file(request):
         
         uploaded_file = request.FILES['file']
         
-        # Validate file size (10MB limit)
-        max_size = 10 * 1024 * 1024  # 10MB
-        if uploaded_file.size > max_size:
-            return JsonResponse({'error': 'File size exceeds 10MB limit'}, status=400)
-        
-        # Validate file type (basic validation)
-        allowed_types = [
-            'text/plain', 'text/csv', 'application/pdf', 
-            'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'image/jpeg', 'image/png', 'image/gif', 'image/webp',
-            'application/json', 'text/markdown'
-        ]
-        
-        if uploaded_file.content_type not in allowed_types:
-            return JsonResponse({
-                'error': f'File type {uploaded_file.content_type} not allowed. '
-                         f'Allowed types: {", ".join(allowed_types)}'
-            }, status=400)
+        # Validate file size (10MB limit) and type (basic validation)
+        error = size_error(uploaded_file.size) or type_error(uploaded_file.content_type)
+        if error:
+            return JsonResponse({'error': error}, status=400)
         
         # Create UploadedFile instance
         file_instance = UploadedFile.objects.create(
@@ -205,11 +425,8 @@ def upload_file(request):
         )
         
         # Add file upload message to chat history
-        if session_id not in CHAT_SESSIONS:
-            CHAT_SESSIONS[session_id] = []
-        
         file_message = f"📎 Uploaded file: {uploaded_file.name} ({file_instance.file_size_formatted})"
-        CHAT_SESSIONS[session_id].append({
+        get_history_backend().append(session_id, {
             "role": "user",
             "content": file_message,
             "file_info": {
@@ -221,17 +438,13 @@ def upload_file(request):
             }
         })
         
+        images.schedule_derivatives(file_instance)
+        events.publish_files_changed(session_id)
+        
         return JsonResponse({
             'status': 'success',
             'message': 'File uploaded successfully',
-            'file_info': {
-                'id': file_instance.id,
-                'filename': uploaded_file.name,
-                'size': file_instance.file_size_formatted,
-                'type': uploaded_file.content_type,
-                'url': file_instance.file_url,
-                'uploaded_at': file_instance.uploaded_at.isoformat()
-            },
+            'file_info': serialize_file(file_instance),
             'session_id': session_id
         })
         
@@ -239,6 +452,88 @@ def upload_file(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def upload_files(request):
+    """Handle several file uploads for a chat session in one request."""
+    # Must be installed before the request body is parsed
+    max_files = upload_config()['MAX_BATCH_FILES']
+    validator = ValidatingUploadHandler(request, max_files=max_files)
+    request.upload_handlers.insert(0, validator)
+    try:
+        session_id = request.POST.get('session_id', '')
+        
+        if validator.too_many:
+            return JsonResponse({'error': f'At most {max_files} file{pluralize(max_files)} can be uploaded at once'}, status=400)
+        
+        if not session_id:
+            return JsonResponse({'error': 'Session ID is required'}, status=400)
+        
+        uploaded_files = [
+            f for f in request.FILES.getlist('files') if not type_error(f.content_type)
+        ]
+        if not uploaded_files and not validator.rejected:
+            return JsonResponse({'error': 'No files provided'}, status=400)
+        
+        if not uploaded_files:
+            return JsonResponse({
+                'error': 'No valid files provided',
+                'rejected': validator.rejected
+            }, status=400)
+        
+        file_instances = save_uploads(session_id, uploaded_files)
+        
+        # Add one chat history entry for the whole batch
+        uploaded = [serialize_file(f) for f in file_instances]
+        names = ', '.join(f"{f.original_filename} ({f.file_size_formatted})" for f in file_instances)
+        get_history_backend().append(session_id, {
+            "role": "user",
+            "content": f"📎 Uploaded {len(file_instances)} file{pluralize(len(file_instances))}: {names}",
+            "file_info": {
+                "files": [
+                    {key: info[key] for key in ('id', 'filename', 'size', 'type', 'url')}
+                    for info in uploaded
+                ]
+            }
+        })
+        
+        for file_instance in file_instances:
+            images.schedule_derivatives(file_instance)
+        events.publish_files_changed(session_id)
+        
+        files_data = session_files_data(session_id)
+        return JsonResponse({
+            'status': 'success',
+            'message': f'{len(file_instances)} file{pluralize(len(file_instances))} uploaded successfully',
+            'uploaded': uploaded,
+            'rejected': validator.rejected,
+            'files': files_data,
+            'count': len(files_data),
+            'session_id': session_id
+        })
+        
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def serialize_file(file_obj):
+    """Return the JSON representation of an uploaded file."""
+    return {
+        'id': file_obj.id,
+        'filename': file_obj.original_filename,
+        'size': file_obj.file_size_formatted,
+        'type': file_obj.content_type,
+        'url': file_obj.file_url,
+        'thumbnail_url': images.thumbnail_url(file_obj),
+        'uploaded_at': file_obj.uploaded_at.isoformat()
+    }
+
+
+def session_files_data(session_id):
+    """Return the JSON representation of all files uploaded in a session."""
+    return [serialize_file(f) for f in UploadedFile.objects.filter(session_id=session_id)]
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def list_files(request):
@@ -248,18 +543,7 @@ def list_files(request):
     if not session_id:
         return JsonResponse({'error': 'Session ID is required'}, status=400)
     
-    files = UploadedFile.objects.filter(session_id=session_id)
-    
-    files_data = []
-    for file_obj in files:
-        files_data.append({
-            'id': file_obj.id,
-            'filename': file_obj.original_filename,
-            'size': file_obj.file_size_formatted,
-            'type': file_obj.content_type,
-            'url': file_obj.file_url,
-            'uploaded_at': file_obj.uploaded_at.isoformat()
-        })
+    files_data = session_files_data(session_id)
     
     return JsonResponse({
         'files': files_data,
@@ -293,6 +577,7 @@ def delete_file(request):
             # Delete the database record
             filename = file_obj.original_filename
             file_obj.delete()
+            events.publish_files_changed(session_id)
             
             return JsonResponse({
                 'status': 'success',
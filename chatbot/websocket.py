@@ -0,0 +1,231 @@
+"""
+Chat over a single WebSocket connection.
+
+One connection per chat session carries chat turns, streamed response
+deltas and file-list change notifications, so the page no longer needs a
+separate HTTP request per message or per file-list refresh.
+
+Frames are JSON text messages with a "type" field.
+
+Client to server:
+    {"type": "chat", "id": "...", "message": "...", "stream": true}
+    {"type": "list_files"}
+    {"type": "ping"} / {"type": "pong"}
+
+Server to client:
+    {"type": "ready", "session_id": "..."}
+    {"type": "delta", "id": "...", "delta": "..."}
+    {"type": "done", "id": "...", "response": "...", "message_count": 2}
+    {"type": "error", "id": "...", "error": "...", "retryable": false}
+    {"type": "files", "files": [...], "count": 1}
+    {"type": "ping"} / {"type": "pong"}
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import events
+from .circuit_breaker import CircuitOpenError
+from .history import get_history_backend
+from .views import session_files_data, stream_response
+
+DEFAULT_CONFIG = {
+    'HEARTBEAT_INTERVAL': 20,
+    'HEARTBEAT_TIMEOUT': 60,
+    'SEND_QUEUE_SIZE': 64,
+}
+
+# Close codes
+CLOSE_GOING_AWAY = 1001
+CLOSE_MISSING_SESSION = 4400
+
+
+async def chat_websocket(scope, receive, send):
+    """ASGI application for the chat WebSocket endpoint."""
+    await ChatConnection(scope, receive, send).run()
+
+
+class ChatConnection:
+    """State for one WebSocket connection bound to a chat session."""
+
+    def __init__(self, scope, receive, send):
+        config = {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_WEBSOCKET', {})}
+        self.heartbeat_interval = config['HEARTBEAT_INTERVAL']
+        self.heartbeat_timeout = config['HEARTBEAT_TIMEOUT']
+        query = parse_qs(scope.get('query_string', b'').decode())
+        self.session_id = query.get('session_id', [''])[0]
+        self.receive = receive
+        self.send = send
+        # Bounded so a slow reader stalls producers instead of growing memory
+        self.outbox = asyncio.Queue(maxsize=config['SEND_QUEUE_SIZE'])
+        self.files_changed = asyncio.Event()
+        self.turn = None
+        self.closed = False
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if not self.session_id:
+            await self.send({'type': 'websocket.close', 'code': CLOSE_MISSING_SESSION})
+            return
+        await self.send({'type': 'websocket.accept'})
+
+        self.loop = asyncio.get_running_loop()
+        self.last_seen = self.loop.time()
+        events.subscribe_files_changed(self.session_id, self._on_files_changed)
+        tasks = [
+            asyncio.create_task(self._writer()),
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._file_notifier()),
+        ]
+        try:
+            await self.push({'type': 'ready', 'session_id': self.session_id})
+            await self._reader()
+        finally:
+            self.closed = True
+            events.unsubscribe_files_changed(self.session_id, self._on_files_changed)
+            if self.turn is not None:
+                self.turn.cancel()
+            for task in tasks:
+                task.cancel()
+            # Release any producer blocked on a full outbox
+            while not self.outbox.empty():
+                self.outbox.get_nowait()
+
+    async def push(self, frame):
+        """Queue a frame for sending, waiting while the outbox is full."""
+        if not self.closed:
+            await self.outbox.put(frame)
+
+    async def _reader(self):
+        while True:
+            message = await self.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            self.last_seen = self.loop.time()
+
+            try:
+                data = json.loads(message.get('text') or message.get('bytes') or '')
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                await self.push({'type': 'error', 'error': 'Invalid JSON', 'retryable': False})
+                continue
+
+            kind = data.get('type') if isinstance(data, dict) else None
+            if kind == 'chat':
+                await self._start_turn(data)
+            elif kind == 'list_files':
+                await self._send_files()
+            elif kind == 'ping':
+                await self.push({'type': 'pong'})
+            elif kind == 'pong':
+                pass
+            else:
+                await self.push({
+                    'type': 'error',
+                    'error': f'Unknown message type: {kind}',
+                    'retryable': False
+                })
+
+    async def _writer(self):
+        while True:
+            frame = await self.outbox.get()
+            if frame.get('type') == 'close':
+                await self.send({'type': 'websocket.close', 'code': frame['code']})
+                return
+            await self.send({'type': 'websocket.send', 'text': json.dumps(frame)})
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if self.loop.time() - self.last_seen > self.heartbeat_timeout:
+                await self.push({'type': 'close', 'code': CLOSE_GOING_AWAY})
+                return
+            await self.push({'type': 'ping'})
+
+    def _on_files_changed(self):
+        # Called from the thread that handled the upload or delete
+        self.loop.call_soon_threadsafe(self.files_changed.set)
+
+    async def _file_notifier(self):
+        while True:
+            await self.files_changed.wait()
+            # Bursts of changes collapse into a single listing
+            self.files_changed.clear()
+            await self._send_files()
+
+    async def _send_files(self):
+        files = await sync_to_async(session_files_data)(self.session_id)
+        await self.push({'type': 'files', 'files': files, 'count': len(files)})
+
+    async def _start_turn(self, data):
+        turn_id = data.get('id')
+        user_message = str(data.get('message', '')).strip()
+        if not user_message:
+            await self.push({
+                'type': 'error', 'id': turn_id, 'error': 'Message is required', 'retryable': False
+            })
+            return
+        if self.turn is not None and not self.turn.done():
+            # One turn at a time per connection; the client retries after "done"
+            await self.push({
+                'type': 'error',
+                'id': turn_id,
+                'error': 'A response is already in progress',
+                'retryable': True
+            })
+            return
+        self.turn = asyncio.create_task(
+            self._run_turn(turn_id, user_message, data.get('stream', True))
+        )
+
+    async def _run_turn(self, turn_id, user_message, stream):
+        history = get_history_backend()
+        user_entry = {"role": "user", "content": user_message}
+
+        def produce(messages):
+            chunks = []
+            deltas = stream_response(messages, user_message)
+            try:
+                for delta in deltas:
+                    if self.closed:
+                        break
+                    chunks.append(delta)
+                    if stream:
+                        asyncio.run_coroutine_threadsafe(
+                            self.push({'type': 'delta', 'id': turn_id, 'delta': delta}),
+                            self.loop
+                        ).result()
+            finally:
+                deltas.close()
+            return ''.join(chunks)
+
+        try:
+            messages = await sync_to_async(history.get_messages)(self.session_id) + [user_entry]
+            ai_response = await sync_to_async(produce, thread_sensitive=False)(messages)
+        except CircuitOpenError as e:
+            await self.push({
+                'type': 'error',
+                'id': turn_id,
+                'error': str(e),
+                'retryable': True,
+                'retry_after': round(e.retry_after, 1)
+            })
+            return
+        except Exception as e:
+            await self.push({'type': 'error', 'id': turn_id, 'error': str(e), 'retryable': False})
+            return
+
+        await sync_to_async(history.append)(self.session_id, user_entry, {
+            "role": "assistant",
+            "content": ai_response
+        })
+        await self.push({
+            'type': 'done',
+            'id': turn_id,
+            'response': ai_response,
+            'message_count': len(messages) + 1
+        })
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'chatbot.middleware.TrafficCaptureMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -83,6 +84,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL lets readers in other workers proceed while one worker writes;
+            # NORMAL sync is durable across application crashes in WAL mode.
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+            ),
+            # Take the write lock up front instead of failing on lock upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -122,6 +136,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies of each file (e.g.
+# chat.3f2a9c1b.js) plus gzip/brotli variants; see mysite/staticfiles.py
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'mysite.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Serve collected static files from Django when DEBUG is off and no web
+# server sits in front of it
+SERVE_STATIC = os.getenv('SERVE_STATIC', 'False').lower() == 'true'
 
 # Media files (uploaded by users)
 MEDIA_URL = '/media/'
@@ -140,3 +170,88 @@ FILE_UPLOAD_PERMISSIONS = 0o644
 # OpenAI Configuration
 # Get your API key from: https://platform.openai.com/api-keys
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Seconds to wait for the upstream model before giving up on a request
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
+
+# Circuit breaker around the upstream model. When the failure rate or the
+# slow-call rate over the sliding window crosses its threshold, chat requests
+# fail immediately with a retryable 503 for OPEN_SECONDS before a probe call
+# is let through.
+UPSTREAM_CIRCUIT_BREAKER = {
+    'WINDOW_SECONDS': 60,
+    'MIN_CALLS': 5,
+    'FAILURE_RATE_THRESHOLD': 0.5,
+    'SLOW_CALL_SECONDS': 20.0,
+    'SLOW_CALL_RATE_THRESHOLD': 0.8,
+    'OPEN_SECONDS': 30,
+    'HALF_OPEN_MAX_CALLS': 1,
+}
+
+# Chat history storage. DatabaseHistoryBackend persists conversations across
+# workers and deploys; 'chatbot.history.MemoryHistoryBackend' keeps them in
+# per-process memory. The database backend writes an HTTP request's appends
+# in one transaction when the request finishes, so the next turn sees them on
+# any worker. Only appends made outside a request (background jobs, WebSocket
+# turns) are batched by the two flush options below.
+CHAT_HISTORY = {
+    'BACKEND': 'chatbot.history.DatabaseHistoryBackend',
+    'OPTIONS': {
+        'flush_size': 50,        # Flush once this many messages are buffered
+        'flush_interval': 2.0,   # ...or the oldest buffered message is this old
+        'cache_size': 1000,      # Sessions kept in the in-process read cache
+        'cache_ttl': 5.0,        # Seconds before a cached session is reloaded
+    },
+}
+# For chatbot.history.MemoryHistoryBackend the OPTIONS are 'compress_after'
+# (seconds before an idle session is compressed, None to disable; default 300),
+# 'compression_level' (zlib level; default 6) and 'compress_batch' (most idle
+# sessions compressed per read or append, so a backlog is spread out; default 8).
+
+# WebSocket chat transport (served by mysite.asgi under an ASGI server)
+CHAT_WEBSOCKET = {
+    'HEARTBEAT_INTERVAL': 20,   # Seconds between server pings
+    'HEARTBEAT_TIMEOUT': 60,    # Close the connection after this long without client frames
+    'SEND_QUEUE_SIZE': 64,      # Outgoing frames buffered before producers wait
+}
+
+# Background chat jobs (POST /chatbot/jobs/). Bulk jobs can never use the
+# reserved workers, so interactive jobs are not queued behind them. Job status
+# is also stored in the database, so any worker can answer a poll.
+CHAT_JOBS = {
+    'WORKERS': 4,
+    'RESERVED_INTERACTIVE_WORKERS': 1,
+    'MAX_QUEUED': 100,     # Per priority lane; further submits get a 429
+    'RESULT_TTL': 600,     # Seconds finished jobs stay available for polling
+    'MAX_WAIT': 30,        # Longest long-poll allowed on the status endpoint
+    'POLL_INTERVAL': 0.25, # Seconds between reads of a job run by another worker
+}
+
+# Batch uploads (POST /chatbot/upload-batch/) write their files to storage in
+# parallel and record them with a single INSERT.
+CHAT_UPLOADS = {
+    'MAX_BATCH_FILES': 20,
+    'WRITE_WORKERS': 4,        # Concurrent storage writes across all requests
+}
+
+# Image uploads get a downscaled, metadata-free JPEG that is sent to the model
+# in place of the original, and a WebP thumbnail for the file list. Both are
+# made in the background and shared between uploads with the same contents.
+CHAT_IMAGES = {
+    'WORKERS': 2,              # 0 makes derivatives during the upload request
+    'MODEL_MAX_SIDE': 1024,    # Longest side of the image sent to the model
+    'MODEL_QUALITY': 80,
+    'MODEL_DETAIL': 'auto',    # Vision detail level requested from the model
+    'THUMBNAIL_SIZE': 256,
+    'THUMBNAIL_QUALITY': 70,
+}
+
+# Record chat, upload and history traffic as JSONL for `manage.py replay`.
+# Message text and file names are redacted and session IDs pseudonymized;
+# the middleware removes itself from the stack while ENABLED is False.
+TRAFFIC_CAPTURE = {
+    'ENABLED': os.getenv('TRAFFIC_CAPTURE', 'False').lower() == 'true',
+    'PATH': BASE_DIR / 'traffic' / 'capture.jsonl',
+    'MAX_BYTES': 50 * 1024 * 1024,  # Rotate after this many bytes
+    'BACKUP_COUNT': 10,             # Rotated files kept (capture.jsonl.1, ...)
+}
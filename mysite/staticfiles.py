@@ -0,0 +1,117 @@
+"""
+Static file storage and serving with content-hashed names.
+
+``collectstatic`` writes each file under a name containing a hash of its
+contents, plus gzip (and, when the ``brotli`` package is installed,
+brotli) compressed copies. Since a hashed name never changes content, those
+files can be cached by browsers indefinitely.
+"""
+
+import functools
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+
+# Smaller files gain nothing from compression
+MIN_COMPRESS_SIZE = 256
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes pre-compressed variants."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed_names):
+            for compressed_name in self._compress(hashed_name):
+                yield hashed_name, compressed_name, True
+
+    def _compress(self, name):
+        if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            # Only keep variants that are actually smaller
+            if len(compressed) >= len(content):
+                continue
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))
+            yield compressed_name
+
+
+@functools.cache
+def hashed_names():
+    """Return the content-hashed names listed in the staticfiles manifest."""
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def serve(request, path):
+    """Serve a collected static file, pre-compressed when the client accepts it.
+
+    Meant for deployments without a separate web server in front of Django.
+    Content-hashed names get far-future cache headers.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404("Invalid static file path")
+    if not os.path.isfile(full_path):
+        raise Http404("Static file not found")
+
+    filename = os.path.basename(full_path)
+    content_type, _ = mimetypes.guess_type(full_path)
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        if candidate in accept_encoding and os.path.isfile(full_path + suffix):
+            encoding, full_path = candidate, full_path + suffix
+            break
+
+    response = FileResponse(
+        open(full_path, 'rb'),
+        filename=filename,
+        content_type=content_type or 'application/octet-stream'
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if path in hashed_names() else DEFAULT_CACHE_CONTROL
+    )
+    return response